@@ -0,0 +1,265 @@
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def inn_key(inn: str) -> int:
+    """Числовой ключ ИНН; длина кодируется, чтобы 10- и 12-значные ИНН не совпадали"""
+    return int(inn) * 100 + len(inn)
+
+
+class BloomFilter:
+    """Фильтр Блума для быстрых отрицательных ответов"""
+
+    def __init__(self, size_bits: int, num_hashes: int, bits: Optional[bytearray] = None):
+        self.size_bits = max(8, size_bits)
+        self.num_hashes = max(1, num_hashes)
+        self.bits = bits if bits is not None else bytearray((self.size_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, fp_rate: float) -> 'BloomFilter':
+        """Фильтр оптимального размера для заданного числа элементов"""
+        capacity = max(1, capacity)
+        size_bits = int(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+        num_hashes = int(round(size_bits / capacity * math.log(2)))
+        return cls(size_bits, num_hashes)
+
+    def _positions(self, key: int):
+        digest = hashlib.blake2b(key.to_bytes(8, 'little'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.size_bits
+
+    def add(self, key: int):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: int) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class BankruptcyMirror:
+    """Локальное зеркало реестра банкротств Федресурса.
+
+    Хранит отсортированный массив ключей ИНН с активными процедурами и фильтр
+    Блума над ним. Для свежего зеркала отрицательный ответ дается локально,
+    в живой API уходят только ИНН, найденные в зеркале.
+
+    Каждая версия зеркала пишется в отдельный каталог, meta.json указывает на
+    текущую версию и хранит размеры и SHA-256 ее файлов: загрузка во время
+    обновления видит либо старую, либо новую версию целиком.
+    """
+
+    INNS_FILE = "inns.bin"
+    BLOOM_FILE = "bloom.bin"
+    META_FILE = "meta.json"
+
+    # Сколько предыдущих версий оставлять для загрузок, начатых до переключения
+    KEEP_VERSIONS = 1
+
+    def __init__(self, mirror_dir: str = Config.FEDRESURS_MIRROR_DIR):
+        self.mirror_dir = mirror_dir
+        self.inns = array('Q')
+        self.bloom: Optional[BloomFilter] = None
+        self.data_as_of: Optional[datetime] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.bloom is not None
+
+    def is_fresh(self) -> bool:
+        """Зеркало загружено, и данные выгрузки не старше окна свежести"""
+        if not self.loaded or self.data_as_of is None:
+            return False
+        return datetime.now() - self.data_as_of < timedelta(hours=Config.FEDRESURS_MIRROR_MAX_AGE_HOURS)
+
+    def load(self) -> bool:
+        """Загрузка текущей версии зеркала с диска"""
+        meta_path = os.path.join(self.mirror_dir, self.META_FILE)
+        if not os.path.exists(meta_path):
+            logger.info("Fedresurs mirror not found, using live API only")
+            return False
+
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+
+            version_dir = os.path.join(self.mirror_dir, meta['version'])
+            inns = array('Q')
+            inns.frombytes(self._read_checked(version_dir, self.INNS_FILE, meta))
+            bloom = BloomFilter(meta['bloom_bits'], meta['bloom_hashes'],
+                                bytearray(self._read_checked(version_dir, self.BLOOM_FILE, meta)))
+
+            self.inns = inns
+            self.bloom = bloom
+            self.data_as_of = datetime.fromisoformat(meta['data_as_of'])
+            logger.info(f"Loaded Fedresurs mirror: {len(inns)} INNs, data as of {meta['data_as_of']}")
+            return True
+        except Exception as e:
+            logger.error("Error loading Fedresurs mirror: %s", e)
+            return False
+
+    @staticmethod
+    def _read_checked(version_dir: str, file_name: str, meta: dict) -> bytes:
+        """Чтение файла версии со сверкой размера и контрольной суммы из meta.json"""
+        with open(os.path.join(version_dir, file_name), 'rb') as f:
+            data = f.read()
+        expected = meta['files'][file_name]
+        if len(data) != expected['size'] or hashlib.sha256(data).hexdigest() != expected['sha256']:
+            raise ValueError(f"{file_name} does not match meta.json")
+        return data
+
+    def is_known_clear(self, inn: str) -> bool:
+        """True, если по свежему зеркалу у ИНН точно нет активной процедуры"""
+        if not inn or not inn.isdigit() or not self.is_fresh():
+            return False
+
+        key = inn_key(inn)
+        if key not in self.bloom:
+            return True
+
+        # Положительный ответ фильтра проверяется по точному списку
+        index = bisect_left(self.inns, key)
+        return index >= len(self.inns) or self.inns[index] != key
+
+    def build(self, export_paths: List[str], as_of: Optional[datetime] = None):
+        """Полная пересборка зеркала из выгрузок реестра.
+
+        as_of - момент, на который актуальны выгрузки; по умолчанию время
+        изменения самого нового файла выгрузки.
+        """
+        keys = set()
+        for path in export_paths:
+            keys.update(self._read_export(path))
+        self._save(keys, as_of or self._files_time(export_paths))
+        logger.info(f"Built Fedresurs mirror with {len(keys)} INNs from {len(export_paths)} exports")
+
+    def apply_delta(self, delta_path: str, as_of: Optional[datetime] = None):
+        """Инкрементальное обновление: строки inn,action (add/remove)"""
+        if not self.loaded and not self.load():
+            raise RuntimeError("Fedresurs mirror is not built yet")
+
+        keys = set(self.inns)
+        added = removed = 0
+        with open(delta_path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                inn = (row.get('inn') or '').strip()
+                if not inn.isdigit():
+                    continue
+                if (row.get('action') or 'add').strip().lower() == 'remove':
+                    keys.discard(inn_key(inn))
+                    removed += 1
+                else:
+                    keys.add(inn_key(inn))
+                    added += 1
+
+        self._save(keys, as_of or self._files_time([delta_path]))
+        logger.info(f"Applied Fedresurs delta: {added} added, {removed} removed")
+
+    @staticmethod
+    def _files_time(paths: List[str]) -> datetime:
+        return datetime.fromtimestamp(max(os.path.getmtime(path) for path in paths))
+
+    def _read_export(self, path: str) -> Iterable[int]:
+        """ИНН с активными процедурами из CSV-выгрузки (колонки inn[, status])"""
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                inn = (row.get('inn') or '').strip()
+                status = (row.get('status') or 'ACTIVE').strip().upper()
+                if inn.isdigit() and status == 'ACTIVE':
+                    yield inn_key(inn)
+
+    def _save(self, keys: set, data_as_of: datetime):
+        """Запись новой версии зеркала и атомарное переключение на нее через meta.json"""
+        inns = array('Q', sorted(keys))
+        bloom = BloomFilter.for_capacity(len(inns), Config.FEDRESURS_MIRROR_FP_RATE)
+        for key in inns:
+            bloom.add(key)
+
+        built_at = datetime.now()
+        version = f"v{built_at.strftime('%Y%m%d%H%M%S%f')}"
+        version_dir = os.path.join(self.mirror_dir, version)
+        os.makedirs(version_dir)
+
+        files = {}
+        for file_name, data in ((self.INNS_FILE, inns.tobytes()), (self.BLOOM_FILE, bytes(bloom.bits))):
+            self._write_file(os.path.join(version_dir, file_name), data)
+            files[file_name] = {'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+
+        meta = {
+            'version': version,
+            'data_as_of': data_as_of.isoformat(),
+            'built_at': built_at.isoformat(),
+            'count': len(inns),
+            'bloom_bits': bloom.size_bits,
+            'bloom_hashes': bloom.num_hashes,
+            'files': files
+        }
+        meta_path = os.path.join(self.mirror_dir, self.META_FILE)
+        self._write_file(f"{meta_path}.tmp", json.dumps(meta).encode('utf-8'))
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+        self.inns = inns
+        self.bloom = bloom
+        self.data_as_of = data_as_of
+        self._remove_old_versions(version)
+
+    @staticmethod
+    def _write_file(path: str, data: bytes):
+        with open(path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _remove_old_versions(self, current: str):
+        """Удаление старых версий, кроме текущей и KEEP_VERSIONS предыдущих"""
+        versions = sorted(
+            name for name in os.listdir(self.mirror_dir)
+            if name.startswith('v') and name != current and os.path.isdir(os.path.join(self.mirror_dir, name))
+        )
+        for name in versions[:max(0, len(versions) - self.KEEP_VERSIONS)]:
+            shutil.rmtree(os.path.join(self.mirror_dir, name), ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальное зеркало реестра банкротств Федресурса")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help="Полная сборка из выгрузок")
+    build_parser.add_argument('exports', nargs='+')
+
+    delta_parser = subparsers.add_parser('delta', help="Применение дельты")
+    delta_parser.add_argument('delta')
+
+    for command_parser in (build_parser, delta_parser):
+        command_parser.add_argument(
+            '--as-of', type=datetime.fromisoformat, default=None,
+            help="Дата актуальности выгрузки (ISO); по умолчанию время изменения файла"
+        )
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    mirror = BankruptcyMirror()
+    if args.command == 'build':
+        mirror.build(args.exports, args.as_of)
+    else:
+        mirror.apply_delta(args.delta, args.as_of)
+
+
+if __name__ == "__main__":
+    main()
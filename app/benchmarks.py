@@ -0,0 +1,401 @@
+import argparse
+import asyncio
+import gc
+import inspect
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+BENCHMARK_DIR = "benchmarks"
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, "baselines.json")
+PAGES_DIR = os.path.join(BENCHMARK_DIR, "pages")
+
+# Допустимое падение пропускной способности и рост пика памяти относительно базовой линии
+THROUGHPUT_TOLERANCE = 0.25
+ALLOCATION_TOLERANCE = 0.20
+
+# Минимальная длительность одного замера: короткие операции повторяются в цикле
+MIN_TIMING_SECONDS = 0.2
+
+REGION_ADDRESSES = [
+    "г. Москва, ул. Тверская, д. 1",
+    "Московская обл., г. Химки, ул. Ленина, д. 5",
+    "Республика Татарстан, г. Казань, ул. Баумана, д. 10",
+    "г. Саратов, ул. Московская, д. 3",
+    "г. Калуга, ул. Кирова, д. 7",
+    "г. Санкт-Петербург, Невский пр., д. 20",
+    "г. Новосибирск, Красный пр., д. 15",
+    "г. Тверь, ул. Советская, д. 2",
+    "",
+]
+PHONE_FORMATS = ["8 (9{0:02d}) {1:03d}-{2:02d}-{3:02d}", "+7 9{0:02d} {1:03d} {2:02d} {3:02d}", "9{0:02d}{1:03d}{2:02d}{3:02d}", "{1:03d}-{2:02d}"]
+
+
+class Benchmark:
+    """Замер одной операции: run(state) обрабатывает items элементов.
+
+    setup() вызывается перед каждым повтором вне замера времени и
+    возвращает состояние для run; cleanup(state) освобождает его.
+    """
+
+    def __init__(self, name: str, items: int, run: Callable, setup: Optional[Callable] = None,
+                 cleanup: Optional[Callable] = None):
+        self.name = name
+        self.items = items
+        self.run = run
+        self.setup = setup
+        self.cleanup = cleanup
+
+
+def _call(loop, func: Callable, *args):
+    result = func(*args)
+    if inspect.isawaitable(result):
+        result = loop.run_until_complete(result)
+    return result
+
+
+def _timed(loop, benchmark: Benchmark, number: int) -> float:
+    """Время number запусков подряд с отключенной сборкой мусора, как в timeit"""
+    state = _call(loop, benchmark.setup) if benchmark.setup else None
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        for _ in range(number):
+            _call(loop, benchmark.run, state)
+        return time.perf_counter() - started
+    finally:
+        if gc_enabled:
+            gc.enable()
+        if benchmark.cleanup:
+            _call(loop, benchmark.cleanup, state)
+
+
+def calibration_rate() -> float:
+    """Скорость эталонного цикла на чистом Python, итераций в секунду (лучший из 3 запусков)"""
+    iterations = 100000
+    best = float('inf')
+    for _ in range(3):
+        started = time.perf_counter()
+        total = 0
+        for i in range(iterations):
+            total += i * i % 7
+        best = min(best, time.perf_counter() - started)
+    return iterations / best
+
+
+def measure(benchmark: Benchmark, repeat: int, loop) -> Dict[str, float]:
+    """Лучшая пропускная способность из repeat повторов и пик выделенной памяти.
+    
+    relative - пропускная способность в единицах эталонного цикла, замеренного
+    рядом с каждым повтором: она не зависит от текущей частоты процессора и
+    соседей по машине и сравнивается с базовой линией.
+    """
+    # Прогрев и подбор числа запусков на замер; с setup состояние одноразовое
+    number = 1
+    elapsed = _timed(loop, benchmark, number)
+    if benchmark.setup is None:
+        number = max(1, int(MIN_TIMING_SECONDS / max(elapsed, 1e-9)))
+
+    best, relative = float('inf'), 0.0
+    for _ in range(repeat):
+        rate = calibration_rate()
+        elapsed = _timed(loop, benchmark, number) / number
+        best = min(best, elapsed)
+        relative = max(relative, benchmark.items / elapsed / rate)
+
+    # Память - в отдельном запуске: трассировка замедляет выполнение
+    state = _call(loop, benchmark.setup) if benchmark.setup else None
+    try:
+        gc.collect()
+        tracemalloc.start()
+        _call(loop, benchmark.run, state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        if benchmark.cleanup:
+            _call(loop, benchmark.cleanup, state)
+
+    return {
+        'items_per_sec': round(benchmark.items / best, 1),
+        # Значащие цифры, а не знаки после запятой: у медленных замеров relative порядка 1e-5
+        'relative': float(f"{relative:.6g}"),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def _raw_leads(count: int, seed: int = 1) -> List[Dict]:
+    """Сырые лиды в разных форматах, как в исходных CSV"""
+    rng = random.Random(seed)
+    leads = []
+    for i in range(count):
+        phone_format = rng.choice(PHONE_FORMATS)
+        leads.append({
+            'lead_id': f"bench_{i:06d}",
+            'fio': rng.choice(["иванов иван иванович", "ПЕТРОВ-ВОДКИН петр", "  сидорова  анна  "]),
+            'phone': phone_format.format(rng.randrange(100), rng.randrange(1000), rng.randrange(100), rng.randrange(100)),
+            'inn': rng.choice([f"{rng.randrange(10 ** 12):012d}", f"77-07-{rng.randrange(10 ** 6):06d}", "", "12ab"]),
+            'dob': f"19{rng.randrange(50, 99)}-0{rng.randrange(1, 9)}-1{rng.randrange(0, 9)}",
+            'address': rng.choice(REGION_ADDRESSES),
+            'source': 'bench',
+            'tags': rng.choice(["", "hot", "cold"]),
+            'email': "",
+            'region': "",
+        })
+    return leads
+
+
+def _enriched_leads(count: int, seed: int = 2) -> List[Dict]:
+    """Обогащенные лиды со смесью случаев для всех правил скоринга"""
+    from .run_clock import today
+
+    rng = random.Random(seed)
+    as_of = today()
+    leads = []
+    for i in range(count):
+        leads.append({
+            'lead_id': f"bench_{i:06d}",
+            'fio': "Иванов Иван",
+            'phone': f"+79{rng.randrange(10 ** 9):09d}",
+            'region': rng.choice(['moscow', 'tatarstan', 'spb']),
+            'fssp_debt_amount': rng.choice([0, 50000, 150000, 300000, 800000]),
+            'fssp_debt_type': rng.choice(['bank', 'mfo', 'tax', 'utility', 'unknown']),
+            'fssp_debt_count': rng.randrange(1, 5),
+            'rosreestr_has_property': rng.random() < 0.3,
+            'court_has_order': rng.random() < 0.4,
+            'court_order_date': as_of - rng.randrange(0, 200),
+            'fedresurs_is_bankrupt': rng.random() < 0.05,
+            'inn_status': rng.choice(['active', 'active', 'active', 'inactive', 'invalid']),
+        })
+    return leads
+
+
+def _normalizer():
+    from .data_normalizer import DataNormalizer
+    normalizer = DataNormalizer()
+    # План нумерации не подключается: замер не зависит от файлов в data/
+    normalizer._phone_resolver_loaded = True
+    return normalizer
+
+
+def normalizer_benchmarks() -> List[Benchmark]:
+    normalizer = _normalizer()
+    raw = _raw_leads(10000)
+    addresses = [lead['address'] for lead in raw]
+    phones = [lead['phone'] for lead in raw]
+    inns = [lead['inn'] for lead in raw]
+
+    def normalize_phone_inn(_):
+        for phone in phones:
+            normalizer._normalize_phone(phone)
+        for inn in inns:
+            normalizer._normalize_inn(inn)
+
+    def extract_region(_):
+        for address in addresses:
+            normalizer._extract_region(address)
+
+    return [
+        Benchmark('normalizer.normalize_data', len(raw), lambda _: normalizer.normalize_data(raw)),
+        Benchmark('normalizer.extract_region', len(addresses), extract_region),
+        Benchmark('normalizer.normalize_phone_inn', len(phones) + len(inns), normalize_phone_inn),
+    ]
+
+
+def scoring_benchmarks() -> List[Benchmark]:
+    from .lead_record import LeadRecord
+    from .scoring_engine import ScoringEngine
+
+    from .run_clock import today
+
+    engine = ScoringEngine()
+    request = {'min_debt': 250000, 'as_of': today()}
+    leads = _enriched_leads(10000)
+
+    async def calculate_score(records):
+        for record in records:
+            await engine.calculate_score(record, request)
+
+    return [
+        Benchmark('scoring.calculate_score', len(leads), calculate_score,
+                  setup=lambda: [LeadRecord(lead) for lead in leads]),
+    ]
+
+
+def database_benchmarks() -> List[Benchmark]:
+    from .database import DatabaseManager
+
+    count = 5000
+    leads = _enriched_leads(count)
+    results = [
+        {**lead, 'score': 60, 'reason_1': "Долг от банка/МФО", 'reason_2': "", 'reason_3': "",
+         'is_target': 1, 'group': 'default_group'}
+        for lead in leads
+    ]
+
+    async def fresh_database(prefill: bool = False):
+        tmp_dir = tempfile.mkdtemp(prefix='bench-db-')
+        db_manager = DatabaseManager(os.path.join(tmp_dir, 'bench.db'))
+        await db_manager.init_database()
+        if prefill:
+            await db_manager.save_leads(leads)
+            await db_manager.save_scoring_results(results, run_id='bench')
+        return tmp_dir, db_manager
+
+    def remove_database(state):
+        shutil.rmtree(state[0], ignore_errors=True)
+
+    query_ids = [lead['lead_id'] for lead in leads[::10]]
+    query_regions = ['moscow', 'spb']
+    region_rows = sum(1 for lead in leads if lead['region'] in query_regions)
+
+    async def query(state):
+        db_manager = state[1]
+        await db_manager.get_latest_results(query_ids)
+        await db_manager.get_leads_by_region(query_regions)
+
+    return [
+        Benchmark('database.save_leads', count, lambda state: state[1].save_leads(leads),
+                  setup=fresh_database, cleanup=remove_database),
+        Benchmark('database.save_scoring_results', count,
+                  lambda state: state[1].save_scoring_results(results, run_id='bench'),
+                  setup=fresh_database, cleanup=remove_database),
+        Benchmark('database.query', len(query_ids) + region_rows, query,
+                  setup=lambda: fresh_database(prefill=True), cleanup=remove_database),
+    ]
+
+
+def html_benchmarks() -> List[Benchmark]:
+    from .html_parser import parse_captcha_form, parse_court_dates, parse_fssp_results
+
+    pages = {}
+    for name in ('fssp_results', 'court_results', 'captcha_form'):
+        with open(os.path.join(PAGES_DIR, f"{name}.html"), encoding='utf-8') as f:
+            pages[name] = f.read()
+
+    def parse_repeatedly(parser: Callable, html: str, times: int = 50):
+        def run(_):
+            for _ in range(times):
+                parser(html)
+        return run
+
+    return [
+        Benchmark('html.parse_fssp_results', 50, parse_repeatedly(parse_fssp_results, pages['fssp_results'])),
+        Benchmark('html.parse_court_dates', 50, parse_repeatedly(parse_court_dates, pages['court_results'])),
+        Benchmark('html.parse_captcha_form', 50, parse_repeatedly(parse_captcha_form, pages['captcha_form'])),
+    ]
+
+
+SUITES = {
+    'normalizer': normalizer_benchmarks,
+    'scoring': scoring_benchmarks,
+    'database': database_benchmarks,
+    'html': html_benchmarks,
+}
+
+
+def load_baselines(path: str = BASELINE_FILE) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baselines(results: Dict[str, Dict], path: str = BASELINE_FILE):
+    """Запись базовой линии; замеры других наборов из старого файла сохраняются"""
+    baselines = load_baselines(path)
+    baselines.setdefault('benchmarks', {}).update(results)
+    baselines['environment'] = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baselines, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def compare(name: str, result: Dict[str, float], baseline: Optional[Dict[str, float]],
+            throughput_tolerance: float, allocation_tolerance: float) -> List[str]:
+    """Регрессии замера относительно базовой линии"""
+    if not baseline:
+        return []
+
+    regressions = []
+    change = result['relative'] / baseline['relative'] - 1
+    if change < -throughput_tolerance:
+        regressions.append(
+            f"{name}: relative throughput {100 * change:+.0f}% vs baseline "
+            f"(tolerance -{100 * throughput_tolerance:.0f}%)"
+        )
+    max_peak = baseline['peak_kb'] * (1 + allocation_tolerance)
+    if result['peak_kb'] > max_peak:
+        regressions.append(
+            f"{name}: peak memory {result['peak_kb']:.0f} KB > {max_peak:.0f} KB "
+            f"(baseline {baseline['peak_kb']:.0f} KB)"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки нормализации, скоринга, базы данных и разбора HTML")
+    parser.add_argument('suites', nargs='*', help=f"Наборы замеров: {', '.join(SUITES)} (по умолчанию все)")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--update-baseline', action='store_true', help="Записать результаты как базовую линию")
+    parser.add_argument('--throughput-tolerance', type=float, default=THROUGHPUT_TOLERANCE)
+    parser.add_argument('--allocation-tolerance', type=float, default=ALLOCATION_TOLERANCE)
+    args = parser.parse_args()
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    logging.basicConfig(level=logging.WARNING)
+
+    baselines = load_baselines().get('benchmarks', {})
+    results: Dict[str, Dict[str, float]] = {}
+    regressions: List[str] = []
+
+    loop = asyncio.new_event_loop()
+    try:
+        for suite in args.suites or list(SUITES):
+            for benchmark in SUITES[suite]():
+                result = measure(benchmark, args.repeat, loop)
+                results[benchmark.name] = result
+
+                baseline = baselines.get(benchmark.name)
+                found = compare(benchmark.name, result, baseline,
+                                args.throughput_tolerance, args.allocation_tolerance)
+                regressions.extend(found)
+
+                change = ""
+                if baseline:
+                    change = f" ({100 * (result['relative'] / baseline['relative'] - 1):+.0f}% vs baseline)"
+                print(
+                    f"{benchmark.name:36} {result['items_per_sec']:12.0f} items/s{change:22} "
+                    f"peak {result['peak_kb']:9.1f} KB{'  REGRESSION' if found else ''}"
+                )
+    finally:
+        loop.close()
+
+    if args.update_baseline:
+        save_baselines(results)
+        print(f"Baseline saved to {BASELINE_FILE}")
+        return
+
+    if regressions:
+        print()
+        for line in regressions:
+            print(line)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
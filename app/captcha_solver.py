@@ -1,4 +1,5 @@
 import logging
+import time
 import requests
 from .config import Config
 
@@ -58,6 +59,6 @@ class CaptchaSolver:
             
             return ""
         except Exception as e:
-            logger.error(f"Error solving captcha: {e}")
+            logger.error("Error solving captcha: %s", e)
             return ""
         
\ No newline at end of file
@@ -11,11 +11,24 @@ class Config:
     COURT_API_URL = "https://sudrf.ru/api/v1/cases"
     FNS_API_URL = "https://service.nalog.ru/inn-proc.do"
     
+    # Локальное зеркало реестра банкротств
+    FEDRESURS_MIRROR_DIR = os.getenv("FEDRESURS_MIRROR_DIR", "data/fedresurs_mirror")
+    FEDRESURS_MIRROR_MAX_AGE_HOURS = 24
+    FEDRESURS_MIRROR_FP_RATE = 0.01
+    
+    # Выгрузки плана нумерации (ABC/DEF) для определения региона по телефону
+    NUMBERING_PLAN_DIR = os.getenv("NUMBERING_PLAN_DIR", "data/numbering_plan")
+    
     # Настройки прокси
     PROXY_FILE = "proxies.txt"
     PROXY_ENABLED = True
     PROXY_TIMEOUT = 10
     
+    # Пул сессий ФССП с решенной капчей
+    FSSP_SESSION_POOL_SIZE = int(os.getenv("FSSP_SESSION_POOL_SIZE", "10"))
+    FSSP_SESSION_TTL = 1800
+    FSSP_CHALLENGE_RETRIES = 1
+    
     # API ключи
     CAPTCHA_API_KEY = os.getenv("CAPTCHA_API_KEY", "your_anti_captcha_key")
     FEDRESURS_API_KEY = os.getenv("FEDRESURS_API_KEY", "your_fedresurs_key")
@@ -25,17 +38,78 @@ class Config:
     MAX_RETRIES = 3
     RETRY_DELAY = 2
     
+    # Бюджет времени на лид и на источник, секунды
+    LEAD_DEADLINE = float(os.getenv("LEAD_DEADLINE", "120"))
+    SOURCE_DEADLINES = {
+        'fns': REQUEST_TIMEOUT,
+        'fedresurs': REQUEST_TIMEOUT,
+        'rosreestr': REQUEST_TIMEOUT,
+        'court': REQUEST_TIMEOUT,
+        'fssp': 60
+    }
+    
+    # Дублирующие запросы для идемпотентных GET-источников
+    HEDGE_SOURCES = ('fedresurs', 'court')
+    HEDGE_QUANTILE = 0.95
+    HEDGE_MIN_SAMPLES = 20
+    HEDGE_MAX_RATIO = 0.1
+    LATENCY_WINDOW = 500
+    
+    # Разбор HTML
+    HTML_PARSER_WORKERS = int(os.getenv("HTML_PARSER_WORKERS", "4"))
+    
+    # Пул процессов для CPU-bound этапов (0 - по числу ядер)
+    PROCESS_POOL_WORKERS = int(os.getenv("PROCESS_POOL_WORKERS", "0"))
+    PROCESS_BATCH_SIZE = 500
+    PROCESS_START_METHOD = "spawn"
+    
     # Лимиты
     MAX_LEADS_PER_RUN = 10000
+    MAX_CONCURRENT_LEADS = int(os.getenv("MAX_CONCURRENT_LEADS", "20"))
     MAX_ERRORS_BEFORE_FAIL = 100
     
     # Настройки логов
     LOG_DIR = "logs"
     LOG_FILE = "app.log"
+    LOG_AGGREGATION_WINDOW = 60
+    LOG_ERROR_BURST = 5
     
     # Пути к данным
     DATA_DIR = "data"
+    REGION_MANIFEST_FILE = "regions_manifest.json"
+    CSV_CHUNK_SIZE = 100000
+    
+    # Кэш нормализованных данных из CSV
+    INGESTION_CACHE_ENABLED = os.getenv("INGESTION_CACHE_ENABLED", "1") == "1"
+    INGESTION_STORE_PATH = os.getenv("INGESTION_STORE_PATH", "data/ingestion_cache.db")
+    INGESTION_MMAP_SIZE = 1024 * 1024 * 1024
+    
+    # Загрузка файлов лидов через POST /api/uploads
+    UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 ** 3)))
+    UPLOAD_CHUNK_SIZE = 1024 * 1024
+    UPLOAD_MAX_HEADER_BYTES = 64 * 1024
+    
     EXPORT_DIR = "exports"
+    RESULTS_FILE = "scoring_ready.csv"
+    
+    # Распределенное обогащение через локальную очередь (python -m app.worker)
+    WORK_QUEUE_ENABLED = os.getenv("WORK_QUEUE_ENABLED", "0") == "1"
+    WORK_QUEUE_PATH = os.getenv("WORK_QUEUE_PATH", "data/work_queue.db")
+    WORK_SHARD_SIZE = 500
+    WORK_LEASE_SECONDS = 600
+    WORK_POLL_INTERVAL = 1.0
+    WORK_RUN_TIMEOUT = 6 * 3600
+    
+    # Выгрузка результатов
+    RESULT_SORT_BUFFER = 100000
+    RESULT_DB_BATCH_SIZE = 1000
+    
+    # Хранение истории запусков
+    RETENTION_KEEP_RUNS = int(os.getenv("RETENTION_KEEP_RUNS", "10"))
+    EXTERNAL_DATA_RETENTION_DAYS = int(os.getenv("EXTERNAL_DATA_RETENTION_DAYS", "30"))
+    RETENTION_BATCH_SIZE = 1000
+    # Запуск в статусе running дольше этого срока считается упавшим
+    RUN_STALE_HOURS = int(os.getenv("RUN_STALE_HOURS", "24"))
     
     @classmethod
     def ensure_directories(cls):
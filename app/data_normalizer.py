@@ -1,39 +1,202 @@
-import pandas as pd
+import asyncio
+import hashlib
 import os
 import re
+import json
 import logging
+from collections import Counter
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, TYPE_CHECKING
 from .config import Config
+from .ingestion_store import IngestionStore, is_lead_file, lead_file_source
+from .lead_record import LeadRecord
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+INN10_WEIGHTS = (2, 4, 10, 3, 5, 9, 4, 6, 8)
+INN12_WEIGHTS_11 = (7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+INN12_WEIGHTS_12 = (3, 7, 2, 4, 10, 3, 5, 9, 4, 6, 8)
+
+
+def _inn_control_digit(digits: str, weights: tuple) -> int:
+    return sum(int(d) * w for d, w in zip(digits, weights)) % 11 % 10
+
+
+def is_valid_inn(inn: str) -> bool:
+    """Проверка контрольных цифр ИНН (10 знаков - юрлицо, 12 знаков - физлицо)"""
+    if not inn or not inn.isdigit():
+        return False
+    
+    if len(inn) == 10:
+        return _inn_control_digit(inn, INN10_WEIGHTS) == int(inn[9])
+    if len(inn) == 12:
+        return (_inn_control_digit(inn, INN12_WEIGHTS_11) == int(inn[10])
+                and _inn_control_digit(inn, INN12_WEIGHTS_12) == int(inn[11]))
+    return False
+
+def dedup_key(record) -> str:
+    """Ключ дедупликации: ФИО+дата рождения или ИНН"""
+    return f"{record['fio']}_{record['dob']}" if record.get('dob') else f"{record['inn']}"
+
+
+def stable_lead_id(record) -> str:
+    """Идентификатор лида по ключу дедупликации.
+    
+    Не зависит от порядка строк и запрошенных регионов, поэтому один и тот
+    же человек получает один lead_id во всех запусках.
+    """
+    return f"lead_{hashlib.sha1(dedup_key(record).encode('utf-8')).hexdigest()[:16]}"
+
+
 class DataNormalizer:
+    # Колонки исходных CSV, которые используются при нормализации
+    INPUT_COLUMNS = ['lead_id', 'fio', 'phone', 'inn', 'dob', 'address', 'tags', 'email', 'region']
+    
+    # Колонки, без которых лид нельзя ни дедуплицировать, ни обогатить
+    REQUIRED_COLUMNS = ['fio', 'phone', 'inn']
+    
+    # Подстрока адреса -> код региона (побеждает первое совпадение)
+    REGION_MAPPING = {
+        'москва': 'moscow',
+        'московская': 'moscow',
+        'татарстан': 'tatarstan',
+        'казань': 'tatarstan',
+        'саратов': 'saratov',
+        'калуга': 'kaluga',
+        'санкт-петербург': 'spb',
+        'петербург': 'spb',
+        'новосибирск': 'nsk'
+    }
+    
     def __init__(self):
         self.phone_pattern = re.compile(r'[^\d]')
         self.inn_pattern = re.compile(r'^\d{10,12}$')
+        self._phone_resolver = None
+        self._phone_resolver_loaded = False
+    
+    @property
+    def phone_resolver(self):
+        """Индекс плана нумерации, загружается при первом обращении; None, если его нет"""
+        if not self._phone_resolver_loaded:
+            from .phone_regions import PhoneRegionResolver
+            try:
+                self._phone_resolver = PhoneRegionResolver.load()
+            except Exception as e:
+                logger.error("Error loading numbering plan: %s", e)
+            self._phone_resolver_loaded = True
+        return self._phone_resolver
     
-    async def load_csv_files(self, data_dir: str = Config.DATA_DIR) -> List[Dict]:
-        """Загрузка всех CSV файлов из директории"""
+    async def load_leads(self, regions: List[str] = None, executor=None,
+                         data_dir: str = Config.DATA_DIR) -> List[LeadRecord]:
+        """Загрузка нормализованных лидов без дублей.
+        
+        При включенном кэше загрузки CSV конвертируются в кэш один раз, а
+        дальше нормализованные записи читаются из него по индексу регионов.
+        """
+        if not Config.INGESTION_CACHE_ENABLED or not os.path.exists(data_dir):
+            raw_data = await self.load_csv_files(data_dir, regions)
+            return await self.normalize_data(raw_data, executor=executor)
+        
+        store = IngestionStore()
+        await asyncio.to_thread(store.sync, data_dir, self)
+        records = await asyncio.to_thread(store.load, regions)
+        
+        normalized_data = self.deduplicate(records)
+        logger.info(f"Loaded {len(normalized_data)} normalized records from ingestion cache, removed {len(records) - len(normalized_data)} duplicates")
+        self._log_region_mismatches(normalized_data)
+        return normalized_data
+    
+    async def load_csv_files(self, data_dir: str = Config.DATA_DIR, regions: List[str] = None) -> List[Dict]:
+        """Загрузка CSV файлов из директории.
+        
+        Если заданы регионы, фильтр применяется при чтении: файлы, которые по
+        манифесту не содержат нужных регионов, пропускаются, а из остальных
+        читаются только нужные колонки и только подходящие строки.
+        """
         all_data = []
         
         if not os.path.exists(data_dir):
-            logger.warning(f"Directory {data_dir} does not exist")
+            logger.warning("Directory %s does not exist", data_dir)
             return self._generate_test_data()
         
-        for file in os.listdir(data_dir):
-            if file.endswith('.csv'):
+        manifest = self._load_region_manifest(data_dir)
+        
+        for file in sorted(os.listdir(data_dir)):
+            if is_lead_file(file):
+                if regions and file in manifest and not set(manifest[file]) & set(regions):
+                    logger.info(f"Skipped {file}: no requested regions in manifest")
+                    continue
+                
                 file_path = os.path.join(data_dir, file)
                 try:
-                    df = pd.read_csv(file_path)
-                    # Добавляем источник
-                    df['source'] = file.replace('.csv', '')
-                    all_data.extend(df.to_dict('records'))
-                    logger.info(f"Loaded {len(df)} records from {file}")
+                    records = self._read_csv(file_path, lead_file_source(file), regions)
+                    all_data.extend(records)
+                    logger.info(f"Loaded {len(records)} records from {file}")
                 except Exception as e:
-                    logger.error(f"Error loading {file}: {e}")
+                    logger.error("Error loading %s: %s", file, e)
         return all_data
     
+    def _load_region_manifest(self, data_dir: str) -> Dict[str, List[str]]:
+        """Загрузка манифеста регионов: имя файла -> список кодов регионов"""
+        manifest_path = os.path.join(data_dir, Config.REGION_MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return {}
+        
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error("Error loading region manifest: %s", e)
+            return {}
+    
+    def _read_csv(self, file_path: str, source: str, regions: List[str] = None) -> List[Dict]:
+        """Чтение CSV по частям с проекцией колонок и фильтром по регионам"""
+        import pandas as pd
+        
+        records = []
+        reader = pd.read_csv(
+            file_path,
+            usecols=lambda column: column in self.INPUT_COLUMNS,
+            dtype=str,
+            keep_default_na=False,
+            chunksize=Config.CSV_CHUNK_SIZE
+        )
+        
+        for chunk in reader:
+            if regions:
+                chunk = chunk[self._chunk_regions(chunk).isin(regions)]
+                if chunk.empty:
+                    continue
+            
+            # Добавляем источник
+            chunk['source'] = source
+            records.extend(chunk.to_dict('records'))
+        return records
+    
+    def _chunk_regions(self, chunk: 'pd.DataFrame') -> 'pd.Series':
+        """Регионы строк части CSV с той же логикой, что и в normalize_record"""
+        import pandas as pd
+        
+        if 'address' in chunk:
+            regions = self._extract_regions(chunk['address'])
+        else:
+            regions = pd.Series('unknown', index=chunk.index)
+        
+        if 'region' in chunk:
+            regions = chunk['region'].where(chunk['region'] != '', regions)
+        
+        # Регион по телефону для строк без региона, как в normalize_records
+        resolver = self.phone_resolver
+        if resolver is not None and 'phone' in chunk:
+            unknown = regions == 'unknown'
+            if unknown.any():
+                regions = regions.copy()
+                regions[unknown] = resolver.resolve_regions(chunk.loc[unknown, 'phone'].tolist())
+        return regions
+    
     def _generate_test_data(self) -> List[Dict]:
         """Генерация тестовых данных"""
         test_data = []
@@ -75,53 +238,109 @@ class DataNormalizer:
         logger.info(f"Generated {len(test_data)} test records")
         return test_data
     
-    async def normalize_data(self, raw_data: List[Dict]) -> List[Dict]:
+    async def normalize_data(self, raw_data: List[Dict], executor=None) -> List[LeadRecord]:
         """Нормализация данных"""
-        normalized_data = []
-        seen_keys = set()
+        if executor is not None:
+            # Нормализация пачками в пуле процессов, дедупликация - здесь
+            normalized = await executor.normalize(raw_data)
+        else:
+            normalized = self.normalize_records(raw_data)
         
+        normalized_data = self.deduplicate(normalized)
+        
+        logger.info(f"Normalized {len(normalized_data)} records, removed {len(raw_data) - len(normalized_data)} duplicates")
+        self._log_region_mismatches(normalized_data)
+        return normalized_data
+    
+    @staticmethod
+    def _log_region_mismatches(records: List[LeadRecord]):
+        """Сводка расхождений региона по телефону и по адресу по загруженным лидам"""
+        mismatches = Counter(
+            (record.get('region'), record.get('region_mismatch'))
+            for record in records
+            if record.get('region_mismatch')
+        )
+        if mismatches:
+            top = ', '.join(f"{region}->{phone_region}: {count}" for (region, phone_region), count in mismatches.most_common(5))
+            logger.info(f"{sum(mismatches.values())} leads have a phone region different from the address region ({top})")
+    
+    def normalize_records(self, raw_data: List[Dict]) -> List[LeadRecord]:
+        """Нормализация пачки записей без дедупликации"""
+        normalized = []
         for record in raw_data:
             try:
-                # Нормализация ФИО
-                fio = self._normalize_fio(record.get('fio', ''))
-                
-                # Нормализация телефона
-                phone = self._normalize_phone(record.get('phone', ''))
-                
-                # Нормализация ИНН
-                inn = self._normalize_inn(record.get('inn', ''))
-                
-                # Создание уникального ключа
-                unique_key = f"{fio}_{record.get('dob', '')}" if record.get('dob') else f"{inn}"
-                
-                # Проверка на дубли
-                if unique_key in seen_keys:
-                    continue
-                
-                seen_keys.add(unique_key)
-                
-                normalized_record = {
-                    'lead_id': record.get('lead_id', f"lead_{len(normalized_data):06d}"),
-                    'fio': fio,
-                    'phone': phone,
-                    'inn': inn,
-                    'dob': record.get('dob', ''),
-                    'address': record.get('address', ''),
-                    'source': record.get('source', 'unknown'),
-                    'tags': record.get('tags', ''),
-                    'email': record.get('email', ''),
-                    'region': record.get('region', self._extract_region(record.get('address', ''))),
-                    'created_at': datetime.now().isoformat()
-                }
-                
-                normalized_data.append(normalized_record)
-                
+                normalized.append(self.normalize_record(record))
             except Exception as e:
-                logger.error(f"Error normalizing record: {e}")
+                logger.error("Error normalizing record: %s", e)
                 continue
         
-        logger.info(f"Normalized {len(normalized_data)} records, removed {len(raw_data) - len(normalized_data)} duplicates")
-        return normalized_data
+        self._resolve_phone_regions(normalized)
+        return normalized
+    
+    def _resolve_phone_regions(self, records: List[LeadRecord]):
+        """Оператор по плану нумерации, заполнение неизвестных регионов и сверка известных"""
+        resolver = self.phone_resolver
+        if resolver is None or not records:
+            return
+        
+        phone_regions, operators = resolver.resolve([record.get('phone') for record in records])
+        filled, mismatched = 0, 0
+        for record, phone_region, operator in zip(records, phone_regions, operators):
+            if operator:
+                record['operator'] = operator
+            if phone_region == 'unknown':
+                continue
+            if record.get('region') == 'unknown':
+                record['region'] = phone_region
+                filled += 1
+            elif record.get('region') != phone_region:
+                record['region_mismatch'] = phone_region
+                mismatched += 1
+        
+        if filled or mismatched:
+            logger.debug(f"Phone regions: {filled} filled, {mismatched} differ from address region")
+    
+    def normalize_record(self, record: Dict) -> LeadRecord:
+        """Нормализация одной записи"""
+        lead = LeadRecord({
+            'lead_id': record.get('lead_id'),
+            'fio': self._normalize_fio(record.get('fio', '')),
+            'phone': self._normalize_phone(record.get('phone', '')),
+            'inn': self._normalize_inn(record.get('inn', '')),
+            'dob': record.get('dob', ''),
+            'address': record.get('address', ''),
+            'source': record.get('source', 'unknown'),
+            'tags': record.get('tags', ''),
+            'email': record.get('email', ''),
+            'region': record.get('region') or self._extract_region(record.get('address', '')),
+            'created_at': datetime.now().isoformat()
+        })
+        # id присваивается до фильтра по регионам и сохраняется в кэше загрузки
+        if not lead.get('lead_id'):
+            lead['lead_id'] = stable_lead_id(lead)
+        return lead
+    
+    def deduplicate(self, records: List[LeadRecord]) -> List[LeadRecord]:
+        """Удаление дублей по ФИО+дате рождения или ИНН"""
+        unique_records = []
+        seen_keys = set()
+        
+        for record in records:
+            # Создание уникального ключа
+            unique_key = dedup_key(record)
+            
+            # Проверка на дубли
+            if unique_key in seen_keys:
+                continue
+            
+            seen_keys.add(unique_key)
+            
+            # Записи кэша, загруженные до появления стабильных id
+            if not record.get('lead_id'):
+                record['lead_id'] = stable_lead_id(record)
+            unique_records.append(record)
+        
+        return unique_records
     
     def _normalize_fio(self, fio: str) -> str:
         """Нормализация ФИО"""
@@ -180,24 +399,24 @@ class DataNormalizer:
         
         address_lower = address.lower()
         
-        region_mapping = {
-            'москва': 'moscow',
-            'московская': 'moscow',
-            'татарстан': 'tatarstan',
-            'казань': 'tatarstan',
-            'саратов': 'saratov',
-            'калуга': 'kaluga',
-            'санкт-петербург': 'spb',
-            'петербург': 'spb',
-            'новосибирск': 'nsk'
-        }
-        
-        for region_name, region_code in region_mapping.items():
+        for region_name, region_code in self.REGION_MAPPING.items():
             if region_name in address_lower:
                 return region_code
         
         return "unknown"
     
+    def _extract_regions(self, addresses: 'pd.Series') -> 'pd.Series':
+        """Векторное извлечение регионов из столбца адресов"""
+        import pandas as pd
+        
+        addresses_lower = addresses.str.lower()
+        regions = pd.Series('unknown', index=addresses.index)
+        
+        # Обход в обратном порядке: первое совпадение в словаре перезаписывает остальные
+        for region_name, region_code in reversed(list(self.REGION_MAPPING.items())):
+            regions = regions.mask(addresses_lower.str.contains(region_name, regex=False), region_code)
+        return regions
+    
     async def filter_by_regions(self, data: List[Dict], regions: List[str]) -> List[Dict]:
         """Фильтрация данных по регионам"""
         if not regions:
@@ -1,7 +1,32 @@
 import aiosqlite
+import argparse
+import asyncio
+import json
 import logging
 from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
 from .config import Config
+from .lead_record import SOURCE_FIELDS
+
+# Колонки хранилища признаков: данные лида для выгрузки и поля всех источников
+FEATURE_COLUMNS = ('lead_id', 'run_id', 'region', 'phone', 'fio') + tuple(
+    field for fields in SOURCE_FIELDS.values() for field in fields
+)
+
+LATEST_RESULTS_UPSERT = """
+    INSERT INTO latest_scoring_results
+    (lead_id, score, reason_1, reason_2, reason_3, is_target, group_name, run_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(lead_id) DO UPDATE SET
+        score = excluded.score,
+        reason_1 = excluded.reason_1,
+        reason_2 = excluded.reason_2,
+        reason_3 = excluded.reason_3,
+        is_target = excluded.is_target,
+        group_name = excluded.group_name,
+        run_id = excluded.run_id,
+        updated_at = CURRENT_TIMESTAMP
+"""
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +38,8 @@ class DatabaseManager:
     async def get_connection(self):
         conn = await aiosqlite.connect(self.db_path)
         try:
+            # WAL: чтение не блокируется записью и очисткой истории
+            await conn.execute("PRAGMA journal_mode=WAL")
             yield conn
         finally:
             await conn.close()
@@ -32,7 +59,21 @@ class DatabaseManager:
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     tags TEXT,
                     email TEXT,
-                    region TEXT
+                    region TEXT,
+                    operator TEXT
+                )
+            """)
+            
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    status TEXT,
+                    regions TEXT,
+                    lead_count INTEGER,
+                    target_count INTEGER,
+                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP,
+                    compacted_at TIMESTAMP
                 )
             """)
             
@@ -47,10 +88,26 @@ class DatabaseManager:
                     is_target INTEGER,
                     group_name TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    run_id TEXT,
                     FOREIGN KEY (lead_id) REFERENCES leads(lead_id)
                 )
             """)
             
+            # Последний результат по каждому лиду, обновляется при каждой записи
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS latest_scoring_results (
+                    lead_id TEXT PRIMARY KEY,
+                    run_id TEXT,
+                    score INTEGER,
+                    reason_1 TEXT,
+                    reason_2 TEXT,
+                    reason_3 TEXT,
+                    is_target INTEGER,
+                    group_name TEXT,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
             await conn.execute("""
                 CREATE TABLE IF NOT EXISTS external_data (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -58,54 +115,263 @@ class DatabaseManager:
                     source TEXT,
                     data TEXT,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    run_id TEXT,
                     FOREIGN KEY (lead_id) REFERENCES leads(lead_id)
                 )
             """)
             
+            # Хранилище признаков: последние данные источников по каждому лиду;
+            # даты (*_updated, court_order_date) - целые дни от 1970-01-01, см. run_clock
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS lead_features (
+                    lead_id TEXT PRIMARY KEY,
+                    run_id TEXT,
+                    region TEXT,
+                    phone TEXT,
+                    fio TEXT,
+                    inn_active INTEGER,
+                    inn_status TEXT,
+                    inn_updated INTEGER,
+                    fedresurs_is_bankrupt INTEGER,
+                    fedresurs_procedure TEXT,
+                    fedresurs_updated INTEGER,
+                    rosreestr_has_property INTEGER,
+                    rosreestr_property_count INTEGER,
+                    rosreestr_updated INTEGER,
+                    court_has_order INTEGER,
+                    court_order_date INTEGER,
+                    court_updated INTEGER,
+                    fssp_debt_amount REAL,
+                    fssp_debt_type TEXT,
+                    fssp_creditor TEXT,
+                    fssp_status TEXT,
+                    fssp_debt_count INTEGER,
+                    fssp_updated INTEGER,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            # Файлы лидов, загруженные через API; хэш содержимого исключает повторную загрузку
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS uploads (
+                    content_hash TEXT PRIMARY KEY,
+                    file_name TEXT NOT NULL,
+                    original_name TEXT,
+                    size INTEGER,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            await self._migrate(conn)
+            
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_scoring_results_run ON scoring_results(run_id)")
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_scoring_results_lead ON scoring_results(lead_id)")
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_external_data_run ON external_data(run_id)")
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_external_data_lead_source ON external_data(lead_id, source, id)")
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_external_data_updated ON external_data(updated_at)")
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_lead_features_region ON lead_features(region)")
+            
             await conn.commit()
             logger.info("Database initialized")
     
+    async def _migrate(self, conn):
+        """Добавление колонок в таблицы, созданные предыдущими версиями схемы"""
+        # run_id в таблицах, созданных до появления запусков; оператор телефона в лидах
+        for table, column in (('scoring_results', 'run_id'), ('external_data', 'run_id'), ('leads', 'operator')):
+            cursor = await conn.execute(f"PRAGMA table_info({table})")
+            columns = {row[1] for row in await cursor.fetchall()}
+            if column not in columns:
+                await conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+                logger.info(f"Added {column} column to {table}")
+        
+        # Заполнение последних результатов из накопленной истории
+        cursor = await conn.execute("SELECT COUNT(*) FROM latest_scoring_results")
+        if (await cursor.fetchone())[0] == 0:
+            await conn.execute("""
+                INSERT OR IGNORE INTO latest_scoring_results
+                (lead_id, run_id, score, reason_1, reason_2, reason_3, is_target, group_name, updated_at)
+                SELECT lead_id, run_id, score, reason_1, reason_2, reason_3, is_target, group_name, created_at
+                FROM scoring_results
+                WHERE id IN (SELECT MAX(id) FROM scoring_results GROUP BY lead_id)
+            """)
+    
+    async def start_run(self, run_id: str, regions: List[str]):
+        async with self.get_connection() as conn:
+            await conn.execute(
+                "INSERT INTO runs (run_id, status, regions) VALUES (?, 'running', ?)",
+                (run_id, json.dumps(regions, ensure_ascii=False))
+            )
+            await conn.commit()
+    
+    async def finish_run(self, run_id: str, status: str, lead_count: int = 0, target_count: int = 0):
+        async with self.get_connection() as conn:
+            await conn.execute("""
+                UPDATE runs SET status = ?, lead_count = ?, target_count = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE run_id = ?
+            """, (status, lead_count, target_count, run_id))
+            await conn.commit()
+    
     async def save_leads(self, leads: list):
         async with self.get_connection() as conn:
-            for lead in leads:
-                await conn.execute("""
-                    INSERT OR IGNORE INTO leads 
-                    (lead_id, fio, phone, inn, dob, address, source, tags, email, region)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    lead.get('lead_id'),
-                    lead.get('fio'),
-                    lead.get('phone'),
-                    lead.get('inn'),
-                    lead.get('dob'),
-                    lead.get('address'),
-                    lead.get('source'),
-                    lead.get('tags'),
-                    lead.get('email'),
-                    lead.get('region')
-                ))
+            await conn.executemany("""
+                INSERT OR IGNORE INTO leads
+                (lead_id, fio, phone, inn, dob, address, source, tags, email, region, operator)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(
+                lead.get('lead_id'),
+                lead.get('fio'),
+                lead.get('phone'),
+                lead.get('inn'),
+                lead.get('dob'),
+                lead.get('address'),
+                lead.get('source'),
+                lead.get('tags'),
+                lead.get('email'),
+                lead.get('region'),
+                lead.get('operator')
+            ) for lead in leads])
             await conn.commit()
             logger.info(f"Saved {len(leads)} leads to database")
     
-    async def save_scoring_results(self, results: list):
+    @staticmethod
+    def _result_row(result: Dict, run_id: Optional[str]) -> tuple:
+        return (
+            result.get('lead_id'),
+            result.get('score'),
+            result.get('reason_1'),
+            result.get('reason_2'),
+            result.get('reason_3'),
+            result.get('is_target'),
+            result.get('group'),
+            run_id
+        )
+    
+    async def save_scoring_results(self, results: list, run_id: Optional[str] = None):
+        rows = [self._result_row(result, run_id) for result in results]
+        
         async with self.get_connection() as conn:
-            for result in results:
-                await conn.execute("""
-                    INSERT INTO scoring_results 
-                    (lead_id, score, reason_1, reason_2, reason_3, is_target, group_name)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    result.get('lead_id'),
-                    result.get('score'),
-                    result.get('reason_1'),
-                    result.get('reason_2'),
-                    result.get('reason_3'),
-                    result.get('is_target'),
-                    result.get('group')
-                ))
+            await conn.executemany("""
+                INSERT INTO scoring_results
+                (lead_id, score, reason_1, reason_2, reason_3, is_target, group_name, run_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            await conn.executemany(LATEST_RESULTS_UPSERT, rows)
             await conn.commit()
             logger.info(f"Saved {len(results)} scoring results to database")
     
+    async def save_latest_results(self, results: list, run_id: Optional[str] = None):
+        """Обновление последних результатов без записи в историю (нецелевые лиды запуска)"""
+        if not results:
+            return
+        async with self.get_connection() as conn:
+            await conn.executemany(LATEST_RESULTS_UPSERT, [
+                self._result_row(result, run_id) for result in results
+            ])
+            await conn.commit()
+    
+    async def save_features(self, leads: list, run_id: Optional[str] = None):
+        """Сохранение обогащенных полей лидов в хранилище признаков.
+        
+        Поля каждого источника обновляются, только если источник опрашивался
+        в этом запуске, поэтому лид, отсеянный раньше, не теряет данные
+        прошлых полных обогащений.
+        """
+        source_updates = ',\n'.join(
+            f"{field} = CASE WHEN excluded.{fields[-1]} IS NOT NULL THEN excluded.{field} ELSE lead_features.{field} END"
+            for fields in SOURCE_FIELDS.values() for field in fields
+        )
+        # Лиды, по которым не ответил ни один источник, не сохраняются
+        leads = [lead for lead in leads if any(lead.get(fields[-1]) for fields in SOURCE_FIELDS.values())]
+        rows = [
+            tuple(run_id if field == 'run_id' else lead.get(field) for field in FEATURE_COLUMNS)
+            for lead in leads
+        ]
+        
+        async with self.get_connection() as conn:
+            await conn.executemany(f"""
+                INSERT INTO lead_features ({', '.join(FEATURE_COLUMNS)})
+                VALUES ({', '.join('?' for _ in FEATURE_COLUMNS)})
+                ON CONFLICT(lead_id) DO UPDATE SET
+                    run_id = excluded.run_id,
+                    region = excluded.region,
+                    phone = excluded.phone,
+                    fio = excluded.fio,
+                    {source_updates},
+                    updated_at = CURRENT_TIMESTAMP
+            """, rows)
+            await conn.commit()
+            logger.info(f"Saved features of {len(leads)} leads")
+    
+    async def iter_features(self, regions: Optional[List[str]], batch_size: int = Config.RESULT_DB_BATCH_SIZE):
+        """Сохраненные признаки лидов регионов пачками словарей; пустой список - все регионы"""
+        columns = [field for field in FEATURE_COLUMNS if field != 'run_id']
+        query = f"SELECT {', '.join(columns)} FROM lead_features"
+        if regions:
+            query += f" WHERE region IN ({','.join('?' for _ in regions)})"
+        async with self.get_connection() as conn:
+            cursor = await conn.execute(query, list(regions or ()))
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield [
+                    {field: value for field, value in zip(columns, row) if value is not None}
+                    for row in rows
+                ]
+    
+    async def get_upload(self, content_hash: str) -> Optional[Dict]:
+        """Загрузка с тем же содержимым, если она уже была"""
+        async with self.get_connection() as conn:
+            cursor = await conn.execute("SELECT * FROM uploads WHERE content_hash = ?", (content_hash,))
+            row = await cursor.fetchone()
+            if row is None:
+                return None
+            columns = [description[0] for description in cursor.description]
+            return dict(zip(columns, row))
+    
+    async def register_upload(self, content_hash: str, file_name: str, original_name: str, size: int) -> Dict:
+        async with self.get_connection() as conn:
+            await conn.execute(
+                "INSERT OR IGNORE INTO uploads (content_hash, file_name, original_name, size) VALUES (?, ?, ?, ?)",
+                (content_hash, file_name, original_name, size)
+            )
+            await conn.commit()
+        return await self.get_upload(content_hash)
+    
+    async def get_target_history(self, features: tuple) -> Dict[str, Dict[str, tuple]]:
+        """Число лидов и целевых среди них по значениям локальных признаков"""
+        history = {}
+        async with self.get_connection() as conn:
+            for feature in features:
+                cursor = await conn.execute(f"""
+                    SELECT l.{feature}, COUNT(*), COALESCE(SUM(CASE WHEN r.is_target = 1 THEN 1 ELSE 0 END), 0)
+                    FROM leads l LEFT JOIN latest_scoring_results r ON r.lead_id = l.lead_id
+                    GROUP BY l.{feature}
+                """)
+                history[feature] = {value: (leads, targets) for value, leads, targets in await cursor.fetchall()}
+        return history
+    
+    async def get_latest_scores(self) -> Dict[str, int]:
+        """Последний балл по каждому лиду"""
+        async with self.get_connection() as conn:
+            cursor = await conn.execute("SELECT lead_id, score FROM latest_scoring_results")
+            return dict(await cursor.fetchall())
+    
+    async def get_latest_results(self, lead_ids: Optional[List[str]] = None) -> List[Dict]:
+        """Последний результат скоринга по лидам без просмотра всей истории"""
+        async with self.get_connection() as conn:
+            query = "SELECT * FROM latest_scoring_results"
+            params = []
+            if lead_ids:
+                query += f" WHERE lead_id IN ({','.join('?' for _ in lead_ids)})"
+                params = list(lead_ids)
+            
+            cursor = await conn.execute(query, params)
+            rows = await cursor.fetchall()
+            
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in rows]
+    
     async def get_leads_by_region(self, regions: list) -> list:
         async with self.get_connection() as conn:
             placeholders = ','.join(['?' for _ in regions])
@@ -116,4 +382,104 @@ class DatabaseManager:
             
             columns = [description[0] for description in cursor.description]
             return [dict(zip(columns, row)) for row in rows]
-        
\ No newline at end of file
+    
+    async def apply_retention(self, keep_runs: int = Config.RETENTION_KEEP_RUNS,
+                              external_days: int = Config.EXTERNAL_DATA_RETENTION_DAYS,
+                              batch_size: int = Config.RETENTION_BATCH_SIZE,
+                              stale_hours: int = Config.RUN_STALE_HOURS) -> Dict[str, int]:
+        """Очистка истории старых запусков и устаревших снимков внешних данных.
+        
+        Удаление идет небольшими пачками, каждая в своей транзакции, поэтому
+        блокировка записи держится недолго. Таблица последних результатов не
+        затрагивается. Освобожденные страницы переиспользуются SQLite, и
+        размер файла перестает расти. Запуски, оставшиеся в статусе running
+        дольше stale_hours (процесс упал до finish_run), помечаются failed.
+        """
+        stats = {'runs': 0, 'scoring_results': 0, 'external_data': 0}
+        
+        async with self.get_connection() as conn:
+            cursor = await conn.execute("""
+                UPDATE runs SET status = 'failed'
+                WHERE status = 'running' AND started_at < datetime('now', ?)
+            """, (f"-{stale_hours} hours",))
+            if cursor.rowcount:
+                logger.warning("Marked %d stale running runs as failed", cursor.rowcount)
+            await conn.commit()
+            
+            cursor = await conn.execute("""
+                SELECT run_id FROM runs
+                WHERE compacted_at IS NULL AND status != 'running'
+                ORDER BY started_at DESC, rowid DESC
+                LIMIT -1 OFFSET ?
+            """, (keep_runs,))
+            old_runs = [row[0] for row in await cursor.fetchall()]
+            
+            for run_id in old_runs:
+                stats['scoring_results'] += await self._delete_in_batches(conn, """
+                    DELETE FROM scoring_results WHERE id IN (
+                        SELECT id FROM scoring_results WHERE run_id = ? LIMIT ?
+                    )
+                """, (run_id,), batch_size)
+                await conn.execute(
+                    "UPDATE runs SET compacted_at = CURRENT_TIMESTAMP WHERE run_id = ?", (run_id,)
+                )
+                await conn.commit()
+                stats['runs'] += 1
+            
+            # Результаты без run_id остались от версий до появления запусков
+            cutoff = f"-{external_days} days"
+            stats['scoring_results'] += await self._delete_in_batches(conn, """
+                DELETE FROM scoring_results WHERE id IN (
+                    SELECT id FROM scoring_results
+                    WHERE run_id IS NULL AND created_at < datetime('now', ?) LIMIT ?
+                )
+            """, (cutoff,), batch_size)
+            
+            # Из внешних данных удаляются старые снимки, последний по источнику остается
+            stats['external_data'] += await self._delete_in_batches(conn, """
+                DELETE FROM external_data WHERE id IN (
+                    SELECT e.id FROM external_data e
+                    WHERE e.updated_at < datetime('now', ?)
+                    AND EXISTS (
+                        SELECT 1 FROM external_data n
+                        WHERE n.lead_id = e.lead_id AND n.source = e.source AND n.id > e.id
+                    )
+                    LIMIT ?
+                )
+            """, (cutoff,), batch_size)
+        
+        logger.info(
+            f"Retention: compacted {stats['runs']} runs, deleted {stats['scoring_results']} "
+            f"scoring results and {stats['external_data']} external data snapshots"
+        )
+        return stats
+    
+    async def _delete_in_batches(self, conn, query: str, params: tuple, batch_size: int) -> int:
+        deleted = 0
+        while True:
+            cursor = await conn.execute(query, (*params, batch_size))
+            await conn.commit()
+            deleted += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return deleted
+            # Пауза между пачками дает место другим писателям
+            await asyncio.sleep(0.01)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Очистка истории запусков скоринга")
+    parser.add_argument('--keep-runs', type=int, default=Config.RETENTION_KEEP_RUNS)
+    parser.add_argument('--external-days', type=int, default=Config.EXTERNAL_DATA_RETENTION_DAYS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def run():
+        db_manager = DatabaseManager()
+        await db_manager.init_database()
+        await db_manager.apply_retention(keep_runs=args.keep_runs, external_days=args.external_days)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
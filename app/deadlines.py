@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import math
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+# Момент (time.monotonic), к которому должно закончиться обогащение текущего лида
+lead_deadline_var: ContextVar[Optional[float]] = ContextVar('lead_deadline', default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Бюджет времени лида или источника исчерпан"""
+
+
+@contextmanager
+def lead_deadline(seconds: float = Config.LEAD_DEADLINE):
+    """Бюджет времени на обогащение лида внутри блока"""
+    token = lead_deadline_var.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        lead_deadline_var.reset(token)
+
+
+class Deadline:
+    """Срок ответа источника: меньшее из бюджета источника и остатка бюджета лида.
+
+    При объединении одинаковых запросов (single-flight) действует срок того
+    лида, который запустил запрос.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self.expires_at = time.monotonic() + Config.SOURCE_DEADLINES.get(source, Config.REQUEST_TIMEOUT)
+        lead_expires_at = lead_deadline_var.get()
+        if lead_expires_at is not None:
+            self.expires_at = min(self.expires_at, lead_expires_at)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def remaining(self) -> float:
+        remaining = self.expires_at - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Deadline exceeded for {self.source}")
+        return remaining
+
+    def timeout(self, limit: float) -> float:
+        """Таймаут одного запроса, не выходящий за срок"""
+        return min(limit, self.remaining())
+
+
+class LatencyTracker:
+    """Скользящие окна задержек успешных запросов по источникам"""
+
+    def __init__(self, window: int = Config.LATENCY_WINDOW):
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._requests = defaultdict(int)
+        self._hedged = defaultdict(int)
+        self._hedge_wins = defaultdict(int)
+
+    def record(self, source: str, seconds: float):
+        self._samples[source].append(seconds)
+
+    def count_request(self, source: str):
+        self._requests[source] += 1
+
+    def count_hedge(self, source: str, won: bool = False):
+        if won:
+            self._hedge_wins[source] += 1
+        else:
+            self._hedged[source] += 1
+
+    def percentile(self, source: str, quantile: float) -> Optional[float]:
+        samples = sorted(self._samples[source])
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(quantile * len(samples)) - 1)]
+
+    def hedge_delay(self, source: str) -> Optional[float]:
+        """Задержка перед дублирующим запросом или None, если дублировать нельзя.
+
+        Дублирование начинается, когда накоплено достаточно замеров, и
+        ограничено долей HEDGE_MAX_RATIO от всех запросов к источнику.
+        """
+        if len(self._samples[source]) < Config.HEDGE_MIN_SAMPLES:
+            return None
+        if self._hedged[source] >= Config.HEDGE_MAX_RATIO * self._requests[source]:
+            return None
+        return self.percentile(source, Config.HEDGE_QUANTILE)
+
+    def stats(self) -> Dict[str, Dict]:
+        return {
+            source: {
+                'requests': self._requests[source],
+                'p50': self.percentile(source, 0.5),
+                'p95': self.percentile(source, 0.95),
+                'hedged': self._hedged[source],
+                'hedge_wins': self._hedge_wins[source]
+            }
+            for source, samples in self._samples.items()
+            if samples
+        }
+
+    def log_stats(self):
+        """Запись статистики задержек в лог"""
+        for source, stats in self.stats().items():
+            logger.info(
+                f"Latency {source}: {stats['requests']} requests, "
+                f"p50 {stats['p50']:.2f}s, p95 {stats['p95']:.2f}s, "
+                f"{stats['hedged']} hedged, {stats['hedge_wins']} won by hedge"
+            )
+
+
+async def timed(tracker: LatencyTracker, source: str, request: Awaitable):
+    """Выполнение запроса с записью задержки"""
+    tracker.count_request(source)
+    started = time.monotonic()
+    result = await request
+    tracker.record(source, time.monotonic() - started)
+    return result
+
+
+async def hedged(tracker: LatencyTracker, source: str,
+                 attempt: Callable[[str], Awaitable], proxies: List[str]):
+    """Запрос с дублированием через другой прокси.
+
+    Первая попытка идет через proxies[0]. Если за p95 задержки источника
+    ответа нет, запускается вторая через первый маршрут, отличный от
+    основного; если такого нет, запрос не дублируется. Берется первый
+    успешный ответ, оставшаяся попытка отменяется. Только для
+    идемпотентных запросов.
+    """
+    primary = proxies[0]
+    alternatives = [proxy for proxy in proxies[1:] if proxy != primary]
+    tasks = [asyncio.ensure_future(timed(tracker, source, attempt(primary)))]
+    try:
+        delay = tracker.hedge_delay(source) if alternatives else None
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                tracker.count_hedge(source)
+                tasks.append(asyncio.ensure_future(timed(tracker, source, attempt(alternatives[0]))))
+
+        pending = set(tasks)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not tasks[0]:
+                        tracker.count_hedge(source, won=True)
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def gather_or_cancel(coros: Iterable[Awaitable]) -> List:
+    """Конкурентное выполнение с отменой остальных задач при первой ошибке.
+
+    Как asyncio.gather, но после первого исключения оставшиеся задачи
+    отменяются и дожидаются, а исключение пробрасывается вызывающему.
+    """
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+        return [task.result() for task in tasks]
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,177 @@
+import logging
+from collections import Counter
+from typing import Dict, Optional
+
+from .data_normalizer import is_valid_inn
+from .lead_record import SOURCE_FIELDS
+from .scoring_engine import ScoringEngine
+from .logging_setup import log_context
+from .deadlines import lead_deadline
+from .retry_queue import RetryQueue
+from .run_clock import RunClock
+
+logger = logging.getLogger(__name__)
+
+
+def resolved_sources(lead: Dict) -> set:
+    """Источники, данные которых уже есть в лиде"""
+    return {source for source, fields in SOURCE_FIELDS.items() if lead.get(fields[-1])}
+
+
+class EnrichmentPlanner:
+    """Порядок обращения к источникам с ранним прекращением обогащения.
+
+    Источники опрашиваются от дешевых и селективных к дорогим: локальная
+    проверка контрольной суммы ИНН, JSON API ФНС и Федресурса, Росреестр,
+    поиск судебных приказов и последней - ФССП с капчей. После каждого
+    источника проверяются фильтры запроса и достижимость целевого балла;
+    если лид уже не может стать целевым, оставшиеся источники не вызываются.
+    """
+
+    SOURCE_ORDER = ['fns', 'fedresurs', 'rosreestr', 'court', 'fssp']
+
+    def __init__(self, parsers, request: Dict, retry_queue: Optional[RetryQueue] = None):
+        self.parsers = parsers
+        self.request = request
+        self.retry_queue = retry_queue or RetryQueue()
+        self.scoring_engine = ScoringEngine()
+        self.clock = RunClock(request.get('as_of'))
+        self.calls = Counter()
+        self.skipped = Counter()
+        self.rejected = Counter()
+
+    async def enrich(self, lead: Dict) -> Dict:
+        """Обогащение лида на месте с ранним прекращением.
+
+        Если лид отсеян, в нем заполняется поле skip_reason. Все источники
+        укладываются в общий бюджет времени лида LEAD_DEADLINE. При ошибке
+        источника лид откладывается в retry_queue (skip_reason='retry_pending')
+        и продолжает обогащение с этого источника при повторе через resume.
+        """
+        with lead_deadline():
+            return await self._enrich(lead, set())
+
+    async def resume(self, lead: Dict, source: str) -> Dict:
+        """Продолжение обогащения отложенного лида с неудавшегося источника"""
+        del lead['skip_reason']
+        resolved = set(self.SOURCE_ORDER[:self.SOURCE_ORDER.index(source)])
+        with log_context(lead_id=lead.get('lead_id')), lead_deadline():
+            return await self._enrich(lead, resolved)
+
+    async def _enrich(self, lead: Dict, resolved: set) -> Dict:
+        enriched = lead
+
+        # Шаг 0: локальная проверка ИНН без обращения к сети
+        if 'fns' not in resolved and not is_valid_inn(enriched.get('inn', '')):
+            enriched.update({
+                'inn_active': False,
+                'inn_status': 'invalid',
+                'inn_updated': self.clock.today
+            })
+            resolved.add('fns')
+
+            skip_reason = self._check_filters('fns', enriched) or self._check_reachable(enriched, resolved)
+            if skip_reason:
+                return self._reject(enriched, skip_reason, resolved)
+
+        for source in self.SOURCE_ORDER:
+            if source in resolved:
+                continue
+
+            self.calls[source] += 1
+            try:
+                result = await self._call_source(source, enriched)
+            except Exception as e:
+                # Остальные источники опрашиваются при повторе
+                self.retry_queue.defer(enriched, source, e)
+                return enriched
+            self.retry_queue.mark_recovered(enriched, source)
+
+            enriched.update(result)
+            resolved.add(source)
+
+            skip_reason = self._check_filters(source, enriched) or self._check_reachable(enriched, resolved)
+            if skip_reason:
+                return self._reject(enriched, skip_reason, resolved)
+
+        return enriched
+
+    def recheck(self, lead: Dict) -> Optional[str]:
+        """Проверка сохраненного лида для текущих параметров без обращения к источникам.
+        
+        Возвращает skip_reason, как при обогащении, или 'not_enriched', если
+        лид был отсеян раньше и для новых параметров нужны не опрошенные
+        источники.
+        """
+        resolved = resolved_sources(lead)
+        for source in self.SOURCE_ORDER:
+            if source in resolved:
+                skip_reason = self._check_filters(source, lead)
+                if skip_reason:
+                    return skip_reason
+        
+        if len(resolved) < len(self.SOURCE_ORDER):
+            return self._check_reachable(lead, resolved) or 'not_enriched'
+        return None
+    
+    def _reject(self, lead: Dict, skip_reason: str, resolved: set) -> Dict:
+        lead['skip_reason'] = skip_reason
+        self.rejected[skip_reason] += 1
+        for source in self.SOURCE_ORDER:
+            if source not in resolved:
+                self.skipped[source] += 1
+        return lead
+
+    async def _call_source(self, source: str, lead: Dict) -> Dict:
+        with log_context(source=source):
+            return await self._dispatch_source(source, lead)
+
+    async def _dispatch_source(self, source: str, lead: Dict) -> Dict:
+        if source == 'fns':
+            return await self.parsers.check_inn_status(lead.get('inn', ''))
+        elif source == 'fedresurs':
+            return await self.parsers.get_fedresurs_data(lead)
+        elif source == 'rosreestr':
+            return await self.parsers.get_rosreestr_data(lead)
+        elif source == 'court':
+            return await self.parsers.get_court_data(lead)
+        elif source == 'fssp':
+            return await self.parsers.get_fssp_data(lead)
+        raise ValueError(f"Unknown source: {source}")
+
+    def _check_filters(self, source: str, lead: Dict) -> Optional[str]:
+        """Проверка фильтров запроса, зависящих от источника"""
+        request = self.request
+
+        if source == 'fns':
+            if request.get('only_active_inn') and lead.get('inn_status') != 'active':
+                return 'inactive_inn'
+        elif source == 'fedresurs':
+            if request.get('exclude_bankrupt') and lead.get('fedresurs_is_bankrupt'):
+                return 'bankrupt'
+        elif source == 'rosreestr':
+            if request.get('only_property') and not lead.get('rosreestr_has_property'):
+                return 'no_property'
+        elif source == 'court':
+            if request.get('only_court_orders') and not lead.get('court_has_order'):
+                return 'no_court_order'
+        elif source == 'fssp':
+            if request.get('exclude_no_debt') and not lead.get('fssp_debt_amount'):
+                return 'no_debt'
+            if request.get('only_bank_mfo') and lead.get('fssp_debt_type') not in ['bank', 'mfo']:
+                return 'not_bank_mfo'
+        return None
+
+    def _check_reachable(self, lead: Dict, resolved: set) -> Optional[str]:
+        """Проверка, что лид еще может набрать целевой балл"""
+        bound = self.scoring_engine.score_upper_bound(lead, self.request, resolved)
+        if bound < ScoringEngine.TARGET_THRESHOLD:
+            return 'score_unreachable'
+        return None
+
+    def log_stats(self):
+        """Запись статистики планировщика в лог"""
+        for source in self.SOURCE_ORDER:
+            logger.info(f"Planner {source}: {self.calls[source]} calls, {self.skipped[source]} skipped")
+        for reason, count in self.rejected.items():
+            logger.info(f"Planner rejected {count} leads: {reason}")
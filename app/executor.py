@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .config import Config
+from .lead_record import LeadRecord
+
+logger = logging.getLogger(__name__)
+
+# Экземпляры, живущие внутри процесса-воркера
+_worker_normalizer = None
+_worker_scoring_engine = None
+
+
+def _init_worker():
+    """Инициализация процесса-воркера"""
+    global _worker_normalizer, _worker_scoring_engine
+    from .data_normalizer import DataNormalizer
+    from .scoring_engine import ScoringEngine
+    _worker_normalizer = DataNormalizer()
+    _worker_scoring_engine = ScoringEngine()
+
+
+def pack_batch(records: List[Dict]) -> Tuple[List[tuple], List[tuple]]:
+    """Упаковка пачки сырых словарей в компактный вид для передачи между процессами.
+
+    Ключи каждой уникальной схемы передаются один раз, записи - кортежами
+    значений со ссылкой на схему. Отсутствующие ключи сохраняются как
+    отсутствующие, а не None, чтобы не менять семантику lead.get(key, default).
+    """
+    schemas = []
+    schema_index = {}
+    rows = []
+    for record in records:
+        keys = tuple(record)
+        idx = schema_index.get(keys)
+        if idx is None:
+            idx = schema_index[keys] = len(schemas)
+            schemas.append(keys)
+        rows.append((idx, tuple(record.values())))
+    return schemas, rows
+
+
+def unpack_batch(packed: Tuple[List[tuple], List[tuple]]) -> List[Dict]:
+    """Распаковка пачки, упакованной pack_batch"""
+    schemas, rows = packed
+    return [dict(zip(schemas[idx], values)) for idx, values in rows]
+
+
+def _normalize_batch(packed) -> List[LeadRecord]:
+    return _worker_normalizer.normalize_records(unpack_batch(packed))
+
+
+def _score_batch(leads: List[LeadRecord], request: Dict) -> List[LeadRecord]:
+    return _worker_scoring_engine.score_batch(leads, request)
+
+
+class PipelineExecutor:
+    """Вынос CPU-bound этапов конвейера в пул процессов"""
+
+    def __init__(self, max_workers: int = Config.PROCESS_POOL_WORKERS,
+                 batch_size: int = Config.PROCESS_BATCH_SIZE):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def started(self) -> bool:
+        return self._pool is not None
+
+    def start(self):
+        """Запуск пула процессов"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context(Config.PROCESS_START_METHOD),
+                initializer=_init_worker
+            )
+            logger.info(f"Process pool started with {self.max_workers} workers")
+
+    def shutdown(self):
+        """Остановка пула процессов"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+            logger.info("Process pool stopped")
+
+    async def run(self, func: Callable, *args):
+        """Выполнение функции в пуле процессов"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, func, *args)
+
+    async def normalize(self, records: List[Dict]) -> List[LeadRecord]:
+        """Нормализация сырых записей пачками в пуле процессов"""
+        batches = [pack_batch(batch) for batch in self._split(records)]
+        return await self._map_batches(_normalize_batch, batches)
+
+    def normalize_iter(self, records: List[Dict]) -> Iterator[LeadRecord]:
+        """Нормализация в пуле процессов для синхронного кода вне event loop.
+
+        Пачки отправляются в пул сразу при вызове, результаты отдаются по
+        мере чтения в исходном порядке.
+        """
+        self.start()
+        batches = self._pool.map(_normalize_batch, [pack_batch(batch) for batch in self._split(records)])
+        return (record for batch in batches for record in batch)
+
+    async def score(self, leads: List[LeadRecord], request: Dict) -> List[LeadRecord]:
+        """Расчет скоринга пачками в пуле процессов.
+
+        LeadRecord сериализуется компактно сам (маска полей и кортеж значений),
+        поэтому лиды передаются без дополнительной упаковки.
+        """
+        return await self._map_batches(_score_batch, self._split(leads), request)
+
+    def _split(self, records: List) -> List[List]:
+        return [records[i:i + self.batch_size] for i in range(0, len(records), self.batch_size)]
+
+    async def _map_batches(self, func: Callable, batches: List, *args) -> List[LeadRecord]:
+        results = await asyncio.gather(*(self.run(func, batch, *args) for batch in batches))
+
+        output = []
+        for batch in results:
+            output.extend(batch)
+        return output
+
+
+_pipeline_executor: Optional[PipelineExecutor] = None
+
+
+def get_pipeline_executor() -> PipelineExecutor:
+    """Общий для процесса экземпляр PipelineExecutor"""
+    global _pipeline_executor
+    if _pipeline_executor is None:
+        _pipeline_executor = PipelineExecutor()
+    return _pipeline_executor
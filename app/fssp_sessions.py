@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from .config import Config
+from .deadlines import Deadline, DeadlineExceeded
+from .html_parser import parse_captcha_form, parse_in_pool
+
+logger = logging.getLogger(__name__)
+
+FSSP_SEARCH_URL = "https://fssp.gov.ru/iss/ip/"
+
+# Заголовки для имитации браузера
+FSSP_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3",
+    "Connection": "keep-alive",
+}
+
+
+class FsspChallengeError(Exception):
+    """Сайт продолжает требовать капчу после ее решения"""
+
+
+class FsspSession:
+    """Сессия ФССП через один прокси: свои cookies и последняя решенная капча"""
+
+    def __init__(self, proxy: str, stats: Counter):
+        self.proxy = proxy
+        self.proxy_url = f"http://{proxy}" if proxy else None
+        self.stats = stats
+        # Отдельный cookie jar на сессию: авторизация привязана к cookies
+        self.http = aiohttp.ClientSession(headers=FSSP_HEADERS)
+        self.captcha_text: Optional[str] = None
+        self.captcha_token: Optional[str] = None
+        self.solved_at = 0.0
+        self.searches = 0
+
+    @property
+    def is_warm(self) -> bool:
+        return bool(self.captcha_text) and time.monotonic() - self.solved_at < Config.FSSP_SESSION_TTL
+
+    async def search(self, form_data: Dict, captcha_solver, deadline: Deadline) -> str:
+        """Поиск на теплой сессии; капча решается только при первом обращении и при новом запросе капчи"""
+        if not self.is_warm:
+            async with self.http.get(
+                FSSP_SEARCH_URL,
+                proxy=self.proxy_url,
+                timeout=deadline.timeout(Config.PROXY_TIMEOUT)
+            ) as response:
+                html = await response.text()
+            await self._solve(await parse_in_pool(parse_captcha_form, html), captcha_solver)
+
+        for _ in range(Config.FSSP_CHALLENGE_RETRIES + 1):
+            async with self.http.post(
+                FSSP_SEARCH_URL,
+                data={**form_data, 'captcha': self.captcha_text, 'captcha_token': self.captcha_token},
+                proxy=self.proxy_url,
+                timeout=deadline.timeout(Config.PROXY_TIMEOUT)
+            ) as response:
+                html = await response.text()
+
+            # Сайт снова показал капчу - сессия остыла, решаем ту, что пришла в ответе
+            captcha_form = await parse_in_pool(parse_captcha_form, html) if 'captcha' in html else None
+            if not captcha_form or not captcha_form['captcha_url']:
+                self.searches += 1
+                self.stats['searches'] += 1
+                return html
+
+            self.stats['challenges'] += 1
+            await self._solve(captcha_form, captcha_solver)
+
+        raise FsspChallengeError("FSSP keeps returning captcha after solving")
+
+    async def _solve(self, captcha_form: Dict, captcha_solver):
+        if not captcha_form['captcha_url']:
+            raise Exception("Captcha image not found")
+
+        self.captcha_text = None
+        # Решение капчи блокирующее и долгое - в отдельном потоке
+        captcha_text = await asyncio.to_thread(captcha_solver.solve_captcha, captcha_form['captcha_url'])
+        if not captcha_text:
+            raise Exception("Failed to solve captcha")
+
+        self.captcha_text = captcha_text
+        self.captcha_token = captcha_form['captcha_token']
+        self.solved_at = time.monotonic()
+        self.stats['captchas'] += 1
+
+    async def close(self):
+        await self.http.close()
+
+
+class FsspSessionPool:
+    """Общий для всех лидов пул теплых сессий ФССП, по одной на прокси.
+
+    Каждая сессия выполняет один поиск за раз и возвращается в пул, поэтому
+    одна решенная капча обслуживает много поисков подряд. Сессия с ошибкой
+    сети закрывается, вместо нее позже создается новая на другом прокси.
+    """
+
+    def __init__(self, proxy_manager, captcha_solver, size: int = Config.FSSP_SESSION_POOL_SIZE):
+        self.proxy_manager = proxy_manager
+        self.captcha_solver = captcha_solver
+        self.size = size
+        self.stats = Counter()
+        self._idle: Optional[asyncio.Queue] = None
+        self._sessions: List[FsspSession] = []
+
+    def _new_session(self) -> FsspSession:
+        used = {session.proxy for session in self._sessions}
+        proxy = next(
+            (proxy for proxy in self.proxy_manager.proxies if proxy not in used),
+            self.proxy_manager.get_random_proxy()
+        )
+        session = FsspSession(proxy, self.stats)
+        self._sessions.append(session)
+        return session
+
+    @asynccontextmanager
+    async def acquire(self, deadline: Deadline):
+        """Сессия из пула на время одного поиска"""
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+
+        if self._idle.empty() and len(self._sessions) < self.size:
+            session = self._new_session()
+        else:
+            # None в очереди - место выбывшей сессии
+            session = await asyncio.wait_for(self._idle.get(), deadline.remaining())
+            if session is None:
+                session = self._new_session()
+
+        try:
+            yield session
+        except BaseException as e:
+            if not self._is_session_failure(e, deadline):
+                self._idle.put_nowait(session)
+                raise
+            # Прокси или сессия сломаны - сессия выбывает из пула
+            self._sessions.remove(session)
+            self._idle.put_nowait(None)
+            await session.close()
+            raise
+        else:
+            self._idle.put_nowait(session)
+
+    @staticmethod
+    def _is_session_failure(error: BaseException, deadline: Deadline) -> bool:
+        """Ошибка сети, прокси или капчи, а не истекший бюджет лида.
+
+        Таймаут считается отказом сессии, только если сработал лимит самого
+        запроса (PROXY_TIMEOUT), а срок лида еще не вышел.
+        """
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+            return not isinstance(error, DeadlineExceeded) and not deadline.expired
+        return isinstance(error, (aiohttp.ClientError, FsspChallengeError))
+
+    async def search(self, form_data: Dict, deadline: Deadline) -> str:
+        async with self.acquire(deadline) as session:
+            return await session.search(form_data, self.captcha_solver, deadline)
+
+    async def close(self):
+        for session in self._sessions:
+            await session.close()
+        self._sessions = []
+        self._idle = None
+
+    def log_stats(self):
+        """Запись статистики капч в лог"""
+        searches = self.stats['searches']
+        if not searches:
+            return
+        logger.info(
+            f"FSSP sessions: {len(self._sessions)} warm, {searches} searches, "
+            f"{self.stats['captchas']} captchas solved ({1000 * self.stats['captchas'] / searches:.1f} per 1000), "
+            f"{self.stats['challenges']} challenges"
+        )
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from bs4 import BeautifulSoup, SoupStrainer
+
+from .config import Config
+from .executor import get_pipeline_executor
+
+logger = logging.getLogger(__name__)
+
+# lxml заметно быстрее встроенного html.parser, но остается опциональным
+try:
+    import lxml  # noqa: F401
+    HTML_BACKEND = "lxml"
+except ImportError:
+    HTML_BACKEND = "html.parser"
+
+# Ограничители разбора: строим дерево только для нужных элементов
+FSSP_RESULT_STRAINER = SoupStrainer(class_="search-result-item")
+COURT_RESULT_STRAINER = SoupStrainer(class_="resultItem")
+CAPTCHA_FORM_STRAINER = SoupStrainer(["img", "input"])
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Ленивое создание пула для разбора HTML"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=Config.HTML_PARSER_WORKERS,
+            thread_name_prefix="html-parser"
+        )
+    return _executor
+
+
+def _text(node) -> str:
+    return node.get_text().strip() if node is not None else ""
+
+
+def parse_captcha_form(html: str) -> Dict:
+    """Извлечение URL и токена капчи со страницы поиска ФССП"""
+    soup = BeautifulSoup(html, HTML_BACKEND, parse_only=CAPTCHA_FORM_STRAINER)
+
+    captcha_img = soup.find('img', {'class': 'captcha-img'})
+    token_input = soup.find('input', {'name': 'captcha_token'})
+
+    return {
+        'captcha_url': captcha_img.get('src') if captcha_img else None,
+        'captcha_token': token_input.get('value') if token_input else None
+    }
+
+
+def parse_fssp_results(html: str) -> List[Dict]:
+    """Извлечение задолженностей из выдачи ФССП"""
+    soup = BeautifulSoup(html, HTML_BACKEND, parse_only=FSSP_RESULT_STRAINER)
+
+    debts = []
+    for row in soup.select('.search-result-item'):
+        try:
+            amount = float(_text(row.select_one('.amount')).replace(' ', '').replace(',', '.'))
+            creditor = row.select_one('.creditor').get_text().strip()
+            debt_type = row.select_one('.type').get_text().strip()
+        except (AttributeError, ValueError):
+            continue
+
+        debts.append({
+            'amount': amount,
+            'creditor': creditor,
+            'type': debt_type
+        })
+    return debts
+
+
+def parse_court_dates(html: str) -> List[str]:
+    """Извлечение дат судебных приказов из выдачи ГАС Правосудие"""
+    soup = BeautifulSoup(html, HTML_BACKEND, parse_only=COURT_RESULT_STRAINER)
+
+    dates = []
+    for item in soup.select('.resultItem'):
+        date_node = item.select_one('.date')
+        if date_node is not None:
+            dates.append(date_node.get_text().strip())
+    return dates
+
+
+async def parse_in_pool(parser: Callable, html: str):
+    """Запуск разбора HTML вне потока event loop"""
+    # Если пул процессов конвейера запущен, разбор уходит туда
+    pipeline_executor = get_pipeline_executor()
+    if pipeline_executor.started:
+        return await pipeline_executor.run(parser, html)
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), parser, html)
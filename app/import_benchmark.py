@@ -0,0 +1,93 @@
+import argparse
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+# Тяжелые модули, которые не должны загружаться при импорте приложения
+HEAVY_MODULES = ('pandas', 'numpy', 'bs4', 'lxml', 'aiohttp', 'requests')
+
+TARGETS = {
+    'fastapi': "import fastapi",
+    'app.main': "import app.main",
+}
+
+
+def measure(statement: str, runs: int) -> List[float]:
+    """Время холодного импорта в отдельном интерпретаторе, мс"""
+    code = (
+        "import time; _t = time.perf_counter(); "
+        f"{statement}; "
+        "print((time.perf_counter() - _t) * 1000)"
+    )
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', code], capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+
+def loaded_heavy_modules(statement: str) -> List[str]:
+    """Тяжелые модули, оказавшиеся в sys.modules после импорта"""
+    code = (
+        f"{statement}; import sys; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True, check=True
+    ).stdout
+    return [name for name in output.strip().split(',') if name]
+
+
+def top_imports(statement: str, limit: int) -> List[str]:
+    """Самые долгие импорты по данным -X importtime"""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        capture_output=True, text=True, check=True
+    ).stderr
+
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # Формат: "import time: <self us> | <cumulative us> | <модуль>"
+        _, cumulative_us, name = line.split(':', 1)[1].split('|')
+        rows.append((int(cumulative_us), name.rstrip()))
+
+    rows.sort(reverse=True)
+    return [f"{cumulative / 1000:8.1f} ms  {name}" for cumulative, name in rows[:limit]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение времени импорта app.main и голого FastAPI")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=0, help="Показать N самых долгих импортов app.main")
+    args = parser.parse_args()
+
+    results: Dict[str, List[float]] = {}
+    for name, statement in TARGETS.items():
+        results[name] = measure(statement, args.runs)
+        print(
+            f"{name:10} median {statistics.median(results[name]):7.1f} ms, "
+            f"min {min(results[name]):7.1f} ms ({args.runs} runs)"
+        )
+
+    overhead = statistics.median(results['app.main']) - statistics.median(results['fastapi'])
+    print(f"app.main overhead over bare FastAPI: {overhead:.1f} ms")
+
+    heavy = loaded_heavy_modules(TARGETS['app.main'])
+    print(f"Heavy modules loaded on import: {', '.join(heavy) if heavy else 'none'}")
+
+    if args.top:
+        print()
+        for line in top_imports(TARGETS['app.main'], args.top):
+            print(line)
+
+    if heavy:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
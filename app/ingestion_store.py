@@ -0,0 +1,217 @@
+import hashlib
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+from .config import Config
+from .executor import get_pipeline_executor
+from .lead_record import LeadRecord
+
+logger = logging.getLogger(__name__)
+
+# Поля нормализованной записи, которые хранятся в кэше
+RECORD_COLUMNS = [
+    'lead_id', 'fio', 'phone', 'inn', 'dob', 'address',
+    'source', 'tags', 'email', 'region', 'created_at', 'operator', 'region_mismatch'
+]
+
+# Файлы лидов в data/: обычный CSV или сжатый gzip
+LEAD_FILE_EXTENSIONS = ('.csv.gz', '.csv')
+
+
+def is_lead_file(file_name: str) -> bool:
+    return file_name.endswith(LEAD_FILE_EXTENSIONS)
+
+
+def lead_file_source(file_name: str) -> str:
+    """Источник лидов по имени файла: leads.csv и leads.csv.gz -> leads"""
+    base_name = os.path.basename(file_name)
+    for extension in LEAD_FILE_EXTENSIONS:
+        if base_name.endswith(extension):
+            return base_name[:-len(extension)]
+    return base_name
+
+
+def file_content_hash(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 содержимого файла, читаемого по частям"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IngestionStore:
+    """Кэш нормализованных записей из CSV-файлов data/.
+
+    Каждый файл конвертируется один раз в SQLite с индексом по региону.
+    Повторная загрузка происходит только если изменились размер, время
+    модификации и содержимое файла.
+    """
+
+    def __init__(self, db_path: str = Config.INGESTION_STORE_PATH):
+        self.db_path = db_path
+
+    @contextmanager
+    def get_connection(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA mmap_size={Config.INGESTION_MMAP_SIZE}")
+            yield conn
+        finally:
+            conn.close()
+
+    def init_store(self):
+        with self.get_connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ingested_files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER,
+                    mtime REAL,
+                    content_hash TEXT,
+                    record_count INTEGER,
+                    ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            columns = ', '.join(f"{column} TEXT" for column in RECORD_COLUMNS)
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS ingested_records (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    path TEXT,
+                    {columns}
+                )
+            """)
+            # Кэш без новых колонок очищается: файлы будут загружены заново
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(ingested_records)")}
+            missing = [column for column in RECORD_COLUMNS if column not in existing]
+            if missing:
+                for column in missing:
+                    conn.execute(f"ALTER TABLE ingested_records ADD COLUMN {column} TEXT")
+                conn.execute("DELETE FROM ingested_records")
+                conn.execute("DELETE FROM ingested_files")
+                logger.info(f"Ingestion cache schema updated ({', '.join(missing)}), files will be re-ingested")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ingested_records_region ON ingested_records(region)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ingested_records_path ON ingested_records(path)")
+            conn.commit()
+
+    def sync(self, data_dir: str, normalizer) -> Dict[str, int]:
+        """Загрузка в кэш новых и изменившихся файлов, удаление пропавших"""
+        self.init_store()
+        stats = {'unchanged': 0, 'ingested': 0, 'removed': 0}
+
+        file_paths = {
+            os.path.join(data_dir, file)
+            for file in os.listdir(data_dir)
+            if is_lead_file(file)
+        }
+
+        with self.get_connection() as conn:
+            known = {
+                row[0]: row[1:]
+                for row in conn.execute("SELECT path, size, mtime, content_hash FROM ingested_files")
+            }
+
+            for path in sorted(file_paths):
+                stat = os.stat(path)
+                cached = known.get(path)
+
+                if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime:
+                    stats['unchanged'] += 1
+                    continue
+
+                content_hash = file_content_hash(path)
+                if cached and cached[2] == content_hash:
+                    # Файл "тронут", но содержимое не изменилось
+                    conn.execute(
+                        "UPDATE ingested_files SET size = ?, mtime = ? WHERE path = ?",
+                        (stat.st_size, stat.st_mtime, path)
+                    )
+                    conn.commit()
+                    stats['unchanged'] += 1
+                    continue
+
+                try:
+                    self._ingest_file(conn, path, stat, content_hash, normalizer)
+                    stats['ingested'] += 1
+                except Exception as e:
+                    conn.rollback()
+                    logger.error("Error ingesting %s: %s", path, e)
+
+            for path in set(known) - file_paths:
+                conn.execute("DELETE FROM ingested_records WHERE path = ?", (path,))
+                conn.execute("DELETE FROM ingested_files WHERE path = ?", (path,))
+                conn.commit()
+                stats['removed'] += 1
+
+        logger.info(
+            f"Ingestion cache: {stats['ingested']} files ingested, "
+            f"{stats['unchanged']} unchanged, {stats['removed']} removed"
+        )
+        return stats
+
+    def _ingest_file(self, conn, path: str, stat, content_hash: str, normalizer):
+        """Конвертация одного CSV в нормализованные записи кэша"""
+        source = lead_file_source(path)
+        placeholders = ', '.join('?' for _ in range(len(RECORD_COLUMNS) + 1))
+        insert_sql = f"INSERT INTO ingested_records (path, {', '.join(RECORD_COLUMNS)}) VALUES ({placeholders})"
+
+        conn.execute("DELETE FROM ingested_records WHERE path = ?", (path,))
+
+        import pandas as pd
+        
+        record_count = 0
+        reader = pd.read_csv(
+            path,
+            usecols=lambda column: column in normalizer.INPUT_COLUMNS,
+            dtype=str,
+            keep_default_na=False,
+            chunksize=Config.CSV_CHUNK_SIZE
+        )
+        # Нормализация идет в пуле процессов конвейера, если он запущен
+        executor = get_pipeline_executor()
+        pending = None
+        for chunk in reader:
+            chunk['source'] = source
+            records = chunk.to_dict('records')
+            if executor.started:
+                normalized = executor.normalize_iter(records)
+            else:
+                normalized = normalizer.normalize_records(records)
+            # Пока пул нормализует эту пачку, в кэш записывается предыдущая
+            if pending is not None:
+                record_count += self._insert_records(conn, insert_sql, path, pending)
+            pending = normalized
+        if pending is not None:
+            record_count += self._insert_records(conn, insert_sql, path, pending)
+
+        conn.execute("""
+            INSERT OR REPLACE INTO ingested_files (path, size, mtime, content_hash, record_count)
+            VALUES (?, ?, ?, ?, ?)
+        """, (path, stat.st_size, stat.st_mtime, content_hash, record_count))
+        conn.commit()
+        logger.info(f"Ingested {record_count} records from {path}")
+
+    @staticmethod
+    def _insert_records(conn, insert_sql: str, path: str, records: Iterable[LeadRecord]) -> int:
+        cursor = conn.executemany(insert_sql, (
+            (path, *(record.get(column) for column in RECORD_COLUMNS))
+            for record in records
+        ))
+        return cursor.rowcount
+
+    def load(self, regions: Optional[List[str]] = None) -> List[LeadRecord]:
+        """Чтение нормализованных записей с фильтром по регионам через индекс"""
+        query = f"SELECT {', '.join(RECORD_COLUMNS)} FROM ingested_records"
+        params = []
+        if regions:
+            query += f" WHERE region IN ({','.join('?' for _ in regions)})"
+            params = list(regions)
+        query += " ORDER BY path, id"
+
+        with self.get_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [LeadRecord(zip(RECORD_COLUMNS, row)) for row in rows]
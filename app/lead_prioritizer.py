@@ -0,0 +1,80 @@
+import heapq
+import logging
+import re
+from typing import Dict, List, Optional
+
+from .config import Config
+from .data_normalizer import is_valid_inn
+
+logger = logging.getLogger(__name__)
+
+PHONE_PATTERN = re.compile(r'\+7\d{10}')
+
+
+class LeadPrioritizer:
+    """Дешевая предварительная оценка лидов по локальным признакам.
+
+    Без обращения к внешним источникам оценивает вероятность, что лид
+    станет целевым: по доле целевых среди прошлых лидов с тем же
+    источником, тегами и регионом, по прошлому баллу самого лида и по
+    валидности ИНН и телефона. Обогащение идет от самых перспективных
+    лидов, так что лимит запуска тратится на них.
+    """
+
+    FEATURES = ('source', 'tags', 'region')
+
+    # Вес априорной доли при сглаживании редких значений признаков
+    PRIOR_WEIGHT = 20
+
+    def __init__(self, feature_history: Optional[Dict[str, Dict[str, tuple]]] = None,
+                 latest_scores: Optional[Dict[str, int]] = None):
+        self.feature_history = feature_history or {}
+        self.latest_scores = latest_scores or {}
+
+        leads, targets = 0, 0
+        for counts in self.feature_history.get(self.FEATURES[0], {}).values():
+            leads += counts[0]
+            targets += counts[1]
+        self.base_rate = (targets + 1) / (leads + 2)
+
+    @classmethod
+    async def load(cls, db_manager) -> 'LeadPrioritizer':
+        """Создание по истории прошлых запусков из базы данных"""
+        try:
+            feature_history = await db_manager.get_target_history(cls.FEATURES)
+            latest_scores = await db_manager.get_latest_scores()
+        except Exception as e:
+            logger.error("Error loading prioritization history: %s", e)
+            return cls()
+        return cls(feature_history, latest_scores)
+
+    def priority(self, lead) -> float:
+        """Оценка вероятности стать целевым (0..1)"""
+        rates = []
+        for feature in self.FEATURES:
+            leads, targets = self.feature_history.get(feature, {}).get(lead.get(feature), (0, 0))
+            rates.append((targets + self.PRIOR_WEIGHT * self.base_rate) / (leads + self.PRIOR_WEIGHT))
+        priority = sum(rates) / len(rates)
+
+        # Лид уже был целевым в прошлых запусках
+        previous_score = self.latest_scores.get(lead.get('lead_id'))
+        if previous_score:
+            priority = max(priority, previous_score / 100)
+
+        # Невалидный ИНН отсеивается планировщиком, по невалидному телефону не дозвониться
+        if not is_valid_inn(lead.get('inn', '')):
+            priority *= 0.1
+        if not PHONE_PATTERN.fullmatch(lead.get('phone') or ''):
+            priority *= 0.5
+        return priority
+
+    def select(self, leads: List, limit: int = Config.MAX_LEADS_PER_RUN) -> List:
+        """Не более limit самых перспективных лидов по убыванию приоритета.
+
+        Ограниченная куча: O(n log limit), при равном приоритете
+        сохраняется исходный порядок.
+        """
+        selected = heapq.nlargest(limit, leads, key=self.priority)
+        if len(selected) < len(leads):
+            logger.info(f"Prioritizer selected {len(selected)} of {len(leads)} leads (MAX_LEADS_PER_RUN={limit})")
+        return selected
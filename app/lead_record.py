@@ -0,0 +1,138 @@
+import sys
+from typing import Dict, Iterator, Tuple
+
+# Поля, заполняемые каждым источником; последнее - отметка времени обращения
+SOURCE_FIELDS = {
+    'fns': ('inn_active', 'inn_status', 'inn_updated'),
+    'fedresurs': ('fedresurs_is_bankrupt', 'fedresurs_procedure', 'fedresurs_updated'),
+    'rosreestr': ('rosreestr_has_property', 'rosreestr_property_count', 'rosreestr_updated'),
+    'court': ('court_has_order', 'court_order_date', 'court_updated'),
+    'fssp': ('fssp_debt_amount', 'fssp_debt_type', 'fssp_creditor', 'fssp_status',
+             'fssp_debt_count', 'fssp_updated'),
+}
+
+
+class LeadRecord:
+    """Компактное представление лида на всем пути через конвейер.
+
+    Поля хранятся в __slots__ вместо словаря, категориальные строки
+    интернируются, а этапы конвейера дописывают поля в ту же запись, не
+    копируя ее. Интерфейс повторяет используемую часть dict (get, [], in,
+    update, keys, items), поэтому код, работающий со словарями, работает
+    и с записью. Незаполненное поле ведет себя как отсутствующий ключ.
+    """
+
+    FIELDS = (
+        # Исходные данные
+        'lead_id', 'fio', 'phone', 'inn', 'dob', 'address', 'source',
+        'tags', 'email', 'region', 'created_at',
+        # По плану нумерации: оператор телефона и регион по телефону, если он отличается от региона по адресу
+        'operator', 'region_mismatch',
+        # ФССП
+        'fssp_debt_amount', 'fssp_debt_type', 'fssp_creditor', 'fssp_status',
+        'fssp_debt_count', 'fssp_updated',
+        # Федресурс
+        'fedresurs_is_bankrupt', 'fedresurs_procedure', 'fedresurs_updated',
+        # Росреестр
+        'rosreestr_has_property', 'rosreestr_property_count', 'rosreestr_updated',
+        # Суды
+        'court_has_order', 'court_order_date', 'court_updated',
+        # ФНС
+        'inn_active', 'inn_status', 'inn_updated',
+        # Скоринг
+        'score', 'reason_1', 'reason_2', 'reason_3', 'is_target', 'group',
+        'skip_reason'
+    )
+
+    # Поля с небольшим набором повторяющихся значений
+    CATEGORICAL_FIELDS = frozenset((
+        'source', 'tags', 'region', 'operator', 'region_mismatch', 'fssp_debt_type', 'fssp_status',
+        'fedresurs_procedure', 'inn_status', 'reason_1', 'reason_2',
+        'reason_3', 'group', 'skip_reason'
+    ))
+
+    __slots__ = FIELDS
+
+    def __init__(self, data=None):
+        if data is not None:
+            self.update(data)
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key: str, value):
+        if key in self.CATEGORICAL_FIELDS and type(value) is str:
+            value = sys.intern(value)
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(f"Unknown lead field: {key}") from None
+
+    def __delitem__(self, key: str):
+        try:
+            delattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key: str) -> bool:
+        return hasattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return self.keys()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.keys())
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (LeadRecord, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"LeadRecord({dict(self.items())!r})"
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    def update(self, data=(), **fields):
+        """Дописать поля в запись (как dict.update)"""
+        items = data.items() if hasattr(data, 'items') else data
+        for key, value in items:
+            self[key] = value
+        for key, value in fields.items():
+            self[key] = value
+
+    def keys(self) -> Iterator[str]:
+        return (field for field in self.FIELDS if hasattr(self, field))
+
+    def items(self) -> Iterator[Tuple[str, object]]:
+        for field in self.FIELDS:
+            try:
+                yield field, getattr(self, field)
+            except AttributeError:
+                continue
+
+    def to_dict(self) -> Dict:
+        return dict(self.items())
+
+    def __getstate__(self):
+        # Маска заполненных полей и кортеж их значений
+        mask = 0
+        values = []
+        for index, field in enumerate(self.FIELDS):
+            try:
+                values.append(getattr(self, field))
+            except AttributeError:
+                continue
+            mask |= 1 << index
+        return mask, tuple(values)
+
+    def __setstate__(self, state):
+        mask, values = state
+        value_iter = iter(values)
+        for index, field in enumerate(self.FIELDS):
+            if mask & (1 << index):
+                self[field] = next(value_iter)
@@ -0,0 +1,204 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Tuple
+
+from .config import Config
+
+# Контекст, который попадает в каждую запись лога
+run_id_var: ContextVar[Optional[str]] = ContextVar('run_id', default=None)
+lead_id_var: ContextVar[Optional[str]] = ContextVar('lead_id', default=None)
+source_var: ContextVar[Optional[str]] = ContextVar('source', default=None)
+
+CONTEXT_FIELDS = (('run_id', run_id_var), ('lead_id', lead_id_var), ('source', source_var))
+
+_listener: Optional[QueueListener] = None
+_flush_stop: Optional[threading.Event] = None
+
+
+@contextmanager
+def log_context(**values):
+    """Установка run_id / lead_id / source для записей лога внутри блока"""
+    tokens = []
+    for name, var in CONTEXT_FIELDS:
+        if name in values:
+            tokens.append((var, var.set(values[name])))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Добавление полей контекста в запись (явный extra имеет приоритет)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for name, var in CONTEXT_FIELDS:
+            if getattr(record, name, None) is None:
+                setattr(record, name, var.get())
+        # QueueHandler подставляет аргументы в msg, шаблон нужен для агрегации
+        record.msg_template = str(record.msg)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-запись на строку"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            'ts': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for name, _ in CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                payload[name] = value
+        if getattr(record, 'suppressed', None):
+            payload['suppressed'] = record.suppressed
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class AggregatingHandler(logging.Handler):
+    """Ограничение частоты одинаковых ошибок со сводками за окно.
+
+    Одинаковыми считаются ошибки с тем же логгером, шаблоном сообщения и
+    источником. В каждом окне пропускаются первые LOG_ERROR_BURST записей,
+    остальные только считаются и по окончании окна выводятся одной сводкой.
+    """
+
+    def __init__(self, handlers: List[logging.Handler],
+                 window: float = Config.LOG_AGGREGATION_WINDOW,
+                 burst: int = Config.LOG_ERROR_BURST):
+        super().__init__()
+        self.handlers = handlers
+        self.window = window
+        self.burst = burst
+        self.window_started = time.monotonic()
+        self.counts: Dict[Tuple, int] = {}
+        self.samples: Dict[Tuple, logging.LogRecord] = {}
+
+    def emit(self, record: logging.LogRecord):
+        self.flush_if_due()
+
+        if record.levelno >= logging.ERROR:
+            template = getattr(record, 'msg_template', str(record.msg))
+            key = (record.name, record.levelno, template, getattr(record, 'source', None))
+            count = self.counts.get(key, 0) + 1
+            self.counts[key] = count
+            if count > self.burst:
+                self.samples[key] = record
+                return
+
+        self._dispatch(record)
+
+    def flush_if_due(self):
+        if time.monotonic() - self.window_started >= self.window:
+            self.flush_summaries()
+
+    def flush_summaries(self):
+        """Вывод сводок по подавленным ошибкам и начало нового окна"""
+        for key, count in self.counts.items():
+            suppressed = count - self.burst
+            if suppressed <= 0:
+                continue
+
+            sample = self.samples[key]
+            summary = logging.LogRecord(
+                sample.name, sample.levelno, sample.pathname, sample.lineno,
+                "Suppressed %d similar errors in %ds, last: %s",
+                (suppressed, int(self.window), sample.getMessage()), None
+            )
+            summary.run_id = sample.run_id
+            summary.lead_id = None
+            summary.source = sample.source
+            summary.suppressed = suppressed
+            self._dispatch(summary)
+
+        self.counts = {}
+        self.samples = {}
+        self.window_started = time.monotonic()
+
+    def _dispatch(self, record: logging.LogRecord):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def close(self):
+        self.flush_summaries()
+        for handler in self.handlers:
+            handler.close()
+        super().close()
+
+
+def setup_logging(level: int = logging.INFO) -> QueueListener:
+    """Неблокирующее логирование: запись в файл идет из отдельного потока"""
+    global _listener, _flush_stop
+    if _listener is not None:
+        return _listener
+
+    Config.ensure_directories()
+
+    file_handler = logging.FileHandler(os.path.join(Config.LOG_DIR, Config.LOG_FILE), encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter())
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    ))
+
+    aggregating_handler = AggregatingHandler([file_handler, stream_handler])
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+
+    _listener = QueueListener(log_queue, aggregating_handler)
+    _listener.start()
+
+    # Сводки выводятся по окончании окна, даже если новых ошибок нет
+    _flush_stop = threading.Event()
+    threading.Thread(
+        target=_flush_loop, args=(aggregating_handler, _flush_stop),
+        name='log-aggregator', daemon=True
+    ).start()
+    return _listener
+
+
+def _flush_loop(handler: AggregatingHandler, stop: threading.Event):
+    while not stop.wait(handler.window):
+        handler.acquire()
+        try:
+            handler.flush_if_due()
+        finally:
+            handler.release()
+
+
+def shutdown_logging():
+    """Остановка фонового потока логирования с выводом оставшихся сводок"""
+    global _listener, _flush_stop
+    if _listener is None:
+        return
+
+    _flush_stop.set()
+    _flush_stop = None
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
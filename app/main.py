@@ -1,31 +1,23 @@
-from fastapi import FastAPI, Request, BackgroundTasks, HTTPException
+from fastapi import FastAPI, APIRouter, Request, BackgroundTasks, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import FileResponse, JSONResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
 from typing import List, Optional, Dict
+from collections import Counter
 import asyncio
 import os
-import csv
+import time
+import uuid
 import logging
-from datetime import datetime
 
-# Импорт модулей
-from .database import DatabaseManager
-from .data_normalizer import DataNormalizer
-from .external_parsers import ExternalParsers
-from .scoring_engine import ScoringEngine
+# Тяжелые модули конвейера (pandas, aiohttp, bs4) импортируются лениво:
+# при первом запуске скоринга, а не при старте воркера
+from .logging_setup import setup_logging, shutdown_logging, log_context
 from .config import Config
+from .run_clock import RunClock, today
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join(Config.LOG_DIR, Config.LOG_FILE)),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 # Модели запросов
@@ -38,6 +30,11 @@ class ScoringRequest(BaseModel):
     only_bank_mfo: bool = False
     only_court_orders: bool = False
     only_active_inn: bool = True
+    top_n: Optional[int] = None
+    # Ранняя остановка: достаточно целевых, бюджет времени (с), бюджет обращений к источникам
+    max_targets: Optional[int] = None
+    time_budget: Optional[int] = None
+    max_lookups: Optional[int] = None
 
 class ScoringStatus(BaseModel):
     status: str  # idle, running, completed, error
@@ -45,6 +42,8 @@ class ScoringStatus(BaseModel):
     message: str
     total_contacts: Optional[int] = None
     errors: Optional[List[str]] = None
+    source_stats: Optional[Dict] = None
+    run_id: Optional[str] = None
 
 # Глобальное состояние
 scoring_status = ScoringStatus(
@@ -53,33 +52,54 @@ scoring_status = ScoringStatus(
     message="Ready to start"
 )
 
-# Инициализация приложения
-app = FastAPI()
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
-
-# Инициализация компонентов
-db_manager = DatabaseManager()
-normalizer = DataNormalizer()
-scoring_engine = ScoringEngine()
-
-# Обеспечиваем существование директорий
-Config.ensure_directories()
+class AppResources:
+    """Общие ресурсы приложения, создаются в lifespan"""
+    
+    def __init__(self):
+        from .database import DatabaseManager
+        from .data_normalizer import DataNormalizer
+        from .scoring_engine import ScoringEngine
+        from .executor import get_pipeline_executor
+        
+        self.db_manager = DatabaseManager()
+        self.normalizer = DataNormalizer()
+        self.scoring_engine = ScoringEngine()
+        self.pipeline_executor = get_pipeline_executor()
+    
+    async def startup(self):
+        await self.db_manager.init_database()
+        self.pipeline_executor.start()
+    
+    async def shutdown(self):
+        self.pipeline_executor.shutdown()
 
-@app.on_event("startup")
-async def startup_event():
-    """Инициализация при запуске"""
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Инициализация при запуске и освобождение ресурсов при остановке"""
+    setup_logging()
     logger.info("Application starting up...")
-    await db_manager.init_database()
+    
+    resources = AppResources()
+    await resources.startup()
+    app.state.resources = resources
     logger.info("Application started")
+    
+    try:
+        yield
+    finally:
+        await resources.shutdown()
+        shutdown_logging()
+
+router = APIRouter()
+templates = Jinja2Templates(directory="templates")
 
-@app.get("/")
+@router.get("/")
 async def read_root(request: Request):
     """Главная страница"""
     return templates.TemplateResponse("index.html", {"request": request})
 
-@app.post("/api/start-scoring")
-async def start_scoring(request: ScoringRequest, background_tasks: BackgroundTasks):
+@router.post("/api/start-scoring")
+async def start_scoring(request: ScoringRequest, background_tasks: BackgroundTasks, http_request: Request):
     """Запуск процесса скоринга"""
     global scoring_status
     
@@ -94,24 +114,24 @@ async def start_scoring(request: ScoringRequest, background_tasks: BackgroundTas
     )
     
     # Запускаем в фоне
-    background_tasks.add_task(run_scoring_process, request)
+    background_tasks.add_task(run_scoring_process, request, http_request.app.state.resources)
     
     return {"status": "started", "message": "Scoring process started"}
 
-@app.get("/api/status")
+@router.get("/api/status")
 async def get_status():
     """Получение текущего статуса скоринга"""
     return scoring_status
 
-@app.get("/api/download-results")
+@router.get("/api/download-results")
 async def download_results():
     """Скачивание результатов"""
-    file_path = os.path.join(Config.EXPORT_DIR, "scoring_ready.csv")
+    file_path = os.path.join(Config.EXPORT_DIR, Config.RESULTS_FILE)
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Results file not found")
-    return FileResponse(file_path, filename="scoring_ready.csv")
+    return FileResponse(file_path, filename=Config.RESULTS_FILE)
 
-@app.get("/api/download-logs")
+@router.get("/api/download-logs")
 async def download_logs():
     """Скачивание логов"""
     file_path = os.path.join(Config.LOG_DIR, Config.LOG_FILE)
@@ -119,126 +139,386 @@ async def download_logs():
         raise HTTPException(status_code=404, detail="Log file not found")
     return FileResponse(file_path, filename="scoring_logs.log")
 
-async def run_scoring_process(request: ScoringRequest):
+@router.post("/api/uploads")
+async def upload_leads(request: Request):
+    """Потоковая загрузка файла лидов (.csv или .csv.gz) в data/.
+
+    Доступна и во время запуска: файл подхватывается следующим запуском.
+    """
+    from .uploads import UploadError, receive_upload
+
+    try:
+        return await receive_upload(request, request.app.state.resources.db_manager)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@router.post("/api/rescore")
+async def rescore(request: ScoringRequest, http_request: Request):
+    """Пересчет скоринга с новыми параметрами по сохраненным признакам, без обогащения"""
+    global scoring_status
+    
+    if scoring_status.status == "running":
+        raise HTTPException(status_code=400, detail="Scoring already in progress")
+    
+    run_id = uuid.uuid4().hex[:12]
+    scoring_status = ScoringStatus(
+        status="running",
+        progress=0,
+        message="Rescoring started...",
+        run_id=run_id
+    )
+    
+    with log_context(run_id=run_id):
+        await _run_rescoring(request, http_request.app.state.resources, run_id)
+    return scoring_status
+
+def run_params(request: ScoringRequest) -> Dict:
+    """Параметры запуска: запрос и опорная дата as_of, общая для процессов скоринга и воркеров"""
+    return {**request.dict(), 'as_of': today()}
+
+async def run_scoring_process(request: ScoringRequest, resources: AppResources):
     """Основной процесс скоринга"""
+    run_id = uuid.uuid4().hex[:12]
+    scoring_status.run_id = run_id
+    
+    # Все записи лога в рамках запуска помечаются его run_id
+    with log_context(run_id=run_id):
+        await _run_scoring_process(request, resources, run_id)
+
+async def _run_scoring_process(request: ScoringRequest, resources: AppResources, run_id: str):
     global scoring_status
     
+    from .result_writer import ResultExporter
+    from .lead_prioritizer import LeadPrioritizer
+    
+    normalizer = resources.normalizer
+    db_manager = resources.db_manager
+    pipeline_executor = resources.pipeline_executor
+    
     try:
-        # Инициализация компонентов
-        parsers = ExternalParsers()
-        await parsers.__aenter__()
+        await db_manager.start_run(run_id, request.regions)
         
         # Шаг 1: Загрузка и нормализация данных
         scoring_status.progress = 10
         scoring_status.message = "Loading data..."
-        raw_data = await normalizer.load_csv_files()
-        normalized_data = await normalizer.normalize_data(raw_data)
+        normalized_data = await normalizer.load_leads(regions=request.regions, executor=pipeline_executor)
         
         # Фильтрация по регионам
         filtered_data = await normalizer.filter_by_regions(normalized_data, request.regions)
         
-        # Шаг 2: Обогащение данными
-        scoring_status.progress = 30
-        scoring_status.message = "Enriching with external data..."
-        enriched_data = []
+        # Самые перспективные лиды первыми, не больше MAX_LEADS_PER_RUN
+        prioritizer = await LeadPrioritizer.load(db_manager)
+        selected_data = prioritizer.select(filtered_data)
         
-        total_items = len(filtered_data)
-        for i, lead in enumerate(filtered_data):
-            # Обновляем прогресс
-            progress = 30 + int(40 * i / total_items)
-            scoring_status.progress = progress
-            scoring_status.message = f"Processing {i+1}/{total_items} leads"
+        # Шаги 2-3: Обогащение и скоринг, в текущем процессе или воркерами очереди
+        exporter = ResultExporter(top_n=request.top_n)
+        try:
+            if Config.WORK_QUEUE_ENABLED:
+                stats = await enrich_and_score_distributed(selected_data, request, exporter, run_id)
+            else:
+                stats = await enrich_and_score(selected_data, request, exporter, resources, run_id)
             
-            # Сбор данных из внешних источников
-            try:
-                # Получаем данные из всех источников
-                fssp_data = await parsers.get_fssp_data(lead)
-                fedresurs_data = await parsers.get_fedresurs_data(lead)
-                rosreestr_data = await parsers.get_rosreestr_data(lead)
-                court_data = await parsers.get_court_data(lead)
-                inn_data = await parsers.check_inn_status(lead.get('inn', ''))
-                
-                # Объединяем все данные
-                enriched_lead = {
-                    **lead,
-                    **fssp_data,
-                    **fedresurs_data,
-                    **rosreestr_data,
-                    **court_data,
-                    **inn_data
-                }
-                enriched_data.append(enriched_lead)
-            except Exception as e:
-                logger.error(f"Error enriching lead {lead.get('lead_id')}: {e}")
-                enriched_data.append(lead)
-        
-        # Шаг 3: Расчет скоринга
-        scoring_status.progress = 80
-        scoring_status.message = "Calculating scores..."
-        scored_data = []
-        for lead in enriched_data:
-            try:
-                scored_lead = await scoring_engine.calculate_score(lead, request.dict())
-                scored_data.append(scored_lead)
-            except Exception as e:
-                logger.error(f"Error scoring lead {lead.get('lead_id')}: {e}")
-                scored_data.append({
-                    **lead,
-                    'score': 0,
-                    'is_target': 0,
-                    'reason_1': 'Error'
-                })
-        
-        # Фильтрация по is_target и score
-        target_leads = [lead for lead in scored_data if lead['is_target'] == 1 and lead['score'] >= 50]
-        target_leads.sort(key=lambda x: x['score'], reverse=True)
-        
-        # Шаг 4: Сохранение результатов
-        scoring_status.progress = 90
-        scoring_status.message = "Saving results..."
-        save_results_to_csv(target_leads)
-        
-        # Сохраняем в базу данных
-        await db_manager.save_leads(normalized_data)
-        await db_manager.save_scoring_results(target_leads)
+            # Шаг 4: Сохранение результатов
+            scoring_status.progress = 90
+            scoring_status.message = "Saving results..."
+            target_count = await exporter.export()
+            
+            # Сохраняем в базу данных
+            await db_manager.save_leads(normalized_data)
+            for batch in exporter.iter_batches():
+                await db_manager.save_scoring_results(batch, run_id=run_id)
+            # Целевые лиды воркеров, не вошедшие в top_n при слиянии
+            await db_manager.save_latest_results(exporter.pop_dropped(), run_id)
+        finally:
+            exporter.close()
         
         # Обновляем статус
+        message = f"Scoring completed. Found {target_count} target contacts"
+        if stats.get('stop_reason'):
+            message += f" (stopped early: {stats['stop_reason']})"
         scoring_status = ScoringStatus(
             status="completed",
             progress=100,
-            message=f"Scoring completed. Found {len(target_leads)} target contacts",
-            total_contacts=len(target_leads)
+            message=message,
+            total_contacts=target_count,
+            errors=[
+                f"{source}: {count} lookups failed after {Config.MAX_RETRIES} retries"
+                for source, count in stats['retry_failed'].items()
+            ] or None,
+            source_stats=stats['source_stats'],
+            run_id=run_id
         )
         
-        await parsers.__aexit__(None, None, None)
+        await db_manager.finish_run(run_id, "completed", len(selected_data), target_count)
+        
+        # История старых запусков удаляется после каждого успешного запуска
+        try:
+            await db_manager.apply_retention()
+        except Exception as e:
+            logger.error("Retention error: %s", e)
         
     except Exception as e:
-        logger.error(f"Scoring process error: {str(e)}", exc_info=True)
+        logger.error("Scoring process error: %s", e, exc_info=True)
         scoring_status = ScoringStatus(
             status="error",
             progress=0,
             message="Scoring process failed",
-            errors=[str(e)]
+            errors=[str(e)],
+            run_id=run_id
+        )
+        try:
+            await db_manager.finish_run(run_id, "error")
+        except Exception as db_error:
+            logger.error("Error saving run status: %s", db_error)
+
+async def _run_rescoring(request: ScoringRequest, resources: AppResources, run_id: str):
+    global scoring_status
+    
+    from .enrichment_planner import EnrichmentPlanner
+    from .lead_record import LeadRecord
+    from .result_writer import ResultExporter, non_target_result
+    
+    db_manager = resources.db_manager
+    request_params = run_params(request)
+    # Планировщик без парсеров: только фильтры запроса и достижимость балла
+    planner = EnrichmentPlanner(None, request_params)
+    skipped = Counter()
+    total = 0
+    
+    try:
+        await db_manager.start_run(run_id, request.regions)
+        
+        exporter = ResultExporter(top_n=request.top_n)
+        try:
+            window = Config.PROCESS_BATCH_SIZE * resources.pipeline_executor.max_workers
+            async for batch in db_manager.iter_features(request.regions, batch_size=window):
+                leads = []
+                non_targets = []
+                for features in batch:
+                    lead = LeadRecord(features)
+                    skip_reason = planner.recheck(lead)
+                    if skip_reason:
+                        skipped[skip_reason] += 1
+                        # Для не обогащенных лидов прошлый результат остается в силе
+                        if skip_reason != 'not_enriched':
+                            lead['skip_reason'] = skip_reason
+                            non_targets.append(non_target_result(lead))
+                    else:
+                        leads.append(lead)
+                
+                total += len(batch)
+                scoring_status.message = f"Rescoring {total} leads..."
+                for lead in await score_leads(leads, request_params, resources):
+                    if not exporter.add(lead):
+                        non_targets.append(non_target_result(lead))
+                non_targets.extend(exporter.pop_dropped())
+                # Лиды, переставшие быть целевыми, не должны оставаться такими в последних результатах
+                await db_manager.save_latest_results([result for result in non_targets if result], run_id)
+            
+            target_count = await exporter.export()
+            for batch in exporter.iter_batches():
+                await db_manager.save_scoring_results(batch, run_id=run_id)
+        finally:
+            exporter.close()
+        
+        logger.info(f"Rescored {total} leads, {target_count} targets, rejected: {dict(skipped)}")
+        scoring_status = ScoringStatus(
+            status="completed",
+            progress=100,
+            message=f"Rescoring completed. Found {target_count} target contacts among {total} stored leads",
+            total_contacts=target_count,
+            errors=[
+                f"{skipped['not_enriched']} leads need enrichment for these parameters"
+            ] if skipped['not_enriched'] else None,
+            run_id=run_id
+        )
+        
+        await db_manager.finish_run(run_id, "completed", total, target_count)
+        try:
+            await db_manager.apply_retention()
+        except Exception as e:
+            logger.error("Retention error: %s", e)
+        
+    except Exception as e:
+        logger.error("Rescoring error: %s", e, exc_info=True)
+        scoring_status = ScoringStatus(
+            status="error",
+            progress=0,
+            message="Rescoring failed",
+            errors=[str(e)],
+            run_id=run_id
         )
+        try:
+            await db_manager.finish_run(run_id, "error")
+        except Exception as db_error:
+            logger.error("Error saving run status: %s", db_error)
 
-def save_results_to_csv(results: List[Dict]):
-    """Сохранение результатов в CSV файл"""
-    file_path = os.path.join(Config.EXPORT_DIR, "scoring_ready.csv")
-    with open(file_path, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            'phone', 'fio', 'score', 'reason_1', 'reason_2', 'reason_3', 'is_target', 'group'
-        ])
-        writer.writeheader()
-        for row in results:
-            writer.writerow({
-                'phone': row.get('phone', ''),
-                'fio': row.get('fio', ''),
-                'score': row.get('score', 0),
-                'reason_1': row.get('reason_1', ''),
-                'reason_2': row.get('reason_2', ''),
-                'reason_3': row.get('reason_3', ''),
-                'is_target': row.get('is_target', 0),
-                'group': row.get('group', '')
+async def enrich_and_score(leads: List, request: ScoringRequest, exporter, resources: AppResources,
+                           run_id: Optional[str] = None) -> Dict:
+    """Обогащение и скоринг в текущем процессе.
+    
+    Лиды приходят упорядоченными по приоритету; обогащение прекращается,
+    когда найдено max_targets целевых или исчерпан бюджет времени или
+    обращений к источникам из запроса.
+    """
+    from .external_parsers import ExternalParsers
+    from .enrichment_planner import EnrichmentPlanner
+    from .retry_queue import ErrorBudgetExceeded
+    from .deadlines import gather_or_cancel
+    from .result_writer import is_exportable, non_target_result
+    from .lead_record import LeadRecord
+    
+    request_params = run_params(request)
+    
+    async with ExternalParsers(RunClock(request_params['as_of'])) as parsers:
+        # Шаг 2: Обогащение данными
+        scoring_status.progress = 30
+        scoring_status.message = "Enriching with external data..."
+        total_items = len(leads)
+        processed = 0
+        targets_found = 0
+        stop_reason = None
+        started = time.monotonic()
+        planner = EnrichmentPlanner(parsers, request_params)
+        pending = iter(leads)
+        enriched_data = []
+        
+        def check_budget() -> Optional[str]:
+            if request.max_targets and targets_found >= request.max_targets:
+                return "enough_targets"
+            if request.time_budget and time.monotonic() - started >= request.time_budget:
+                return "time_budget"
+            if request.max_lookups and sum(planner.calls.values()) >= request.max_lookups:
+                return "max_lookups"
+            return None
+        
+        async def enrich_lead(lead):
+            nonlocal processed, targets_found
+            # Сбор данных из внешних источников в порядке стоимости
+            with log_context(lead_id=lead.get('lead_id')):
+                try:
+                    enriched_lead = await planner.enrich(lead)
+                except ErrorBudgetExceeded:
+                    raise
+                except Exception as e:
+                    logger.error("Error enriching lead %s: %s", lead.get('lead_id'), e)
+                    enriched_lead = lead
+            
+            # Целевые считаются сразу, только если нужна остановка по их числу: оценивается копия
+            # (микросекунды на лида), сам лид оценивается позже вместе с остальными окнами
+            if request.max_targets and not enriched_lead.get('skip_reason'):
+                if is_exportable(resources.scoring_engine.score_lead(LeadRecord(enriched_lead), request_params)):
+                    targets_found += 1
+            
+            # Обновляем прогресс
+            processed += 1
+            scoring_status.progress = 30 + int(40 * processed / total_items)
+            scoring_status.message = f"Processing {processed}/{total_items} leads"
+        
+        async def consume():
+            nonlocal stop_reason
+            for lead in pending:
+                stop_reason = stop_reason or check_budget()
+                if stop_reason:
+                    break
+                enriched_data.append(lead)
+                await enrich_lead(lead)
+        
+        # Лиды обогащаются конкурентно в порядке приоритета, одинаковые запросы объединяются;
+        # ошибка одного обработчика (например, исчерпан бюджет ошибок) останавливает остальные
+        await gather_or_cancel(consume() for _ in range(Config.MAX_CONCURRENT_LEADS))
+        if stop_reason:
+            logger.info(f"Enrichment stopped early ({stop_reason}) after {processed} of {total_items} leads")
+        
+        # Повтор неудачных обращений к источникам после основного прохода, если бюджет не исчерпан
+        retry_queue = planner.retry_queue
+        if retry_queue.pending and stop_reason not in ("time_budget", "max_lookups"):
+            scoring_status.progress = 70
+            scoring_status.message = f"Retrying {retry_queue.pending} failed source lookups..."
+            await retry_queue.drain(planner.resume)
+        
+        parsers.single_flight.log_stats()
+        planner.log_stats()
+        parsers.latency.log_stats()
+        parsers.fssp_sessions.log_stats()
+        retry_queue.log_stats()
+    
+    # Признаки сохраняются до отсева: по ним работает пересчет через /api/rescore
+    try:
+        await resources.db_manager.save_features(enriched_data, run_id)
+    except Exception as e:
+        logger.error("Error saving lead features: %s", e)
+    
+    # Отсеянные планировщиком лиды и лиды с недоступными источниками не могут стать целевыми
+    non_targets = [result for result in map(non_target_result, enriched_data) if result]
+    enriched_data = [lead for lead in enriched_data if not lead.get('skip_reason')]
+    
+    # Шаг 3: Расчет скоринга
+    scoring_status.progress = 80
+    scoring_status.message = "Calculating scores..."
+    
+    # Скоринг окнами: в выгрузку попадают только целевые лиды
+    window = Config.PROCESS_BATCH_SIZE * resources.pipeline_executor.max_workers
+    for start in range(0, len(enriched_data), window):
+        for lead in await score_leads(enriched_data[start:start + window], request_params, resources):
+            if not exporter.add(lead):
+                result = non_target_result(lead)
+                if result:
+                    non_targets.append(result)
+        non_targets.extend(exporter.pop_dropped())
+    
+    # Целевые записываются из выгрузки, остальные лиды запуска снимаются с целевых в последних результатах
+    try:
+        await resources.db_manager.save_latest_results(non_targets, run_id)
+    except Exception as e:
+        logger.error("Error saving non-target results: %s", e)
+    
+    return {
+        'source_stats': parsers.single_flight.stats(),
+        'retry_failed': dict(retry_queue.failed),
+        'stop_reason': stop_reason
+    }
+
+async def enrich_and_score_distributed(leads: List, request: ScoringRequest, exporter, run_id: str) -> Dict:
+    """Обогащение и скоринг воркерами (python -m app.worker) через локальную очередь"""
+    from .work_queue import Coordinator
+    
+    scoring_status.progress = 30
+    scoring_status.message = "Waiting for workers..."
+    
+    def on_progress(done: int, total: int):
+        scoring_status.progress = 30 + int(50 * done / total) if total else 80
+        scoring_status.message = f"Processed {done}/{total} shards"
+    
+    return await Coordinator().run(run_id, leads, run_params(request), exporter, on_progress)
+
+async def score_leads(leads: List, request_params: Dict, resources: AppResources) -> List:
+    """Скоринг пачки лидов в пуле процессов с запасным вариантом в текущем процессе"""
+    try:
+        return await resources.pipeline_executor.score(leads, request_params)
+    except Exception as e:
+        logger.error("Error scoring leads in process pool: %s", e)
+    
+    scored_data = []
+    for lead in leads:
+        try:
+            scored_lead = await resources.scoring_engine.calculate_score(lead, request_params)
+            scored_data.append(scored_lead)
+        except Exception as e:
+            logger.error("Error scoring lead %s: %s", lead.get('lead_id'), e)
+            lead.update({
+                'score': 0,
+                'is_target': 0,
+                'reason_1': 'Error'
             })
-    logger.info(f"Saved {len(results)} records to {file_path}")
-    
\ No newline at end of file
+            scored_data.append(lead)
+    return scored_data
+
+def create_app() -> FastAPI:
+    """Фабрика приложения"""
+    app = FastAPI(lifespan=lifespan)
+    app.mount("/static", StaticFiles(directory="static"), name="static")
+    app.include_router(router)
+    return app
+
+app = create_app()
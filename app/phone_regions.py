@@ -0,0 +1,184 @@
+import logging
+import os
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_REGION = 'unknown'
+
+# Подстрока региона из плана нумерации -> код региона; дополняет REGION_MAPPING нормализатора
+PLAN_REGION_MAPPING = {
+    'калужская': 'kaluga',
+}
+
+
+# Веса разрядов 10-значного номера
+DIGIT_WEIGHTS = 10 ** np.arange(9, -1, -1, dtype=np.int64)
+
+
+def phone_numbers(phones: Iterable[str]) -> np.ndarray:
+    """10-значные номера (без +7) как int64; -1 для номеров, которые не нормализуются.
+
+    Канонические номера +7XXXXXXXXXX разбираются как матрица символов
+    фиксированной ширины без построчной обработки; остальные форматы - по
+    тем же правилам, что в DataNormalizer._normalize_phone.
+    """
+    phones = phones if isinstance(phones, list) else list(phones)
+    chars = np.array(phones, dtype='U13').view(np.uint32).reshape(len(phones), 13)
+    digits = chars[:, 2:12].astype(np.int64) - ord('0')
+
+    canonical = (
+        (chars[:, 0] == ord('+')) & (chars[:, 1] == ord('7')) & (chars[:, 12] == 0)
+        & ((digits >= 0) & (digits <= 9)).all(axis=1)
+    )
+    numbers = np.where(canonical, digits @ DIGIT_WEIGHTS, -1)
+
+    rest = np.flatnonzero(~canonical)
+    if len(rest):
+        numbers[rest] = _parse_phone_numbers([phones[i] for i in rest])
+    return numbers
+
+
+def _parse_phone_numbers(phones: list) -> np.ndarray:
+    """Разбор произвольных форматов: 10 цифр или 11 цифр, начинающихся с 7 или 8"""
+    import pandas as pd
+
+    digits = pd.Series(phones, dtype=object).fillna('').astype(str).str.replace(r'\D', '', regex=True)
+    lengths = digits.str.len()
+    national = digits.where(lengths == 10, digits.str[1:])
+    valid = (lengths == 10) | ((lengths == 11) & digits.str[0].isin(['7', '8']))
+    numbers = pd.to_numeric(national.where(valid), errors='coerce')
+    return numbers.fillna(-1).to_numpy(dtype=np.int64)
+
+
+class PhoneRegionResolver:
+    """Регион и оператор телефона по диапазонам плана нумерации (ABC/DEF).
+
+    Диапазоны хранятся в отсортированных массивах начал и концов, поиск -
+    векторный бинарный (np.searchsorted) сразу по всему столбцу телефонов.
+    Источник - выгрузки реестра плана нумерации (ABC-3xx.csv, ABC-4xx.csv,
+    ABC-8xx.csv, DEF-9xx.csv) в NUMBERING_PLAN_DIR; разобранный индекс
+    сохраняется рядом в index.npz и пересобирается при изменении выгрузок.
+    """
+
+    INDEX_FILE = "index.npz"
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, region_ids: np.ndarray,
+                 operator_ids: np.ndarray, regions: np.ndarray, operators: np.ndarray):
+        self.starts = starts
+        self.ends = ends
+        self.region_ids = region_ids
+        self.operator_ids = operator_ids
+        self.regions = regions
+        self.operators = operators
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    @classmethod
+    def load(cls, plan_dir: str = Config.NUMBERING_PLAN_DIR) -> Optional['PhoneRegionResolver']:
+        """Загрузка индекса; None, если выгрузок плана нумерации нет"""
+        if not os.path.isdir(plan_dir):
+            return None
+        plan_files = sorted(os.path.join(plan_dir, file) for file in os.listdir(plan_dir) if file.endswith('.csv'))
+        if not plan_files:
+            return None
+
+        index_path = os.path.join(plan_dir, cls.INDEX_FILE)
+        if os.path.exists(index_path) and os.path.getmtime(index_path) >= max(map(os.path.getmtime, plan_files)):
+            with np.load(index_path, allow_pickle=False) as index:
+                resolver = cls(*(index[name] for name in (
+                    'starts', 'ends', 'region_ids', 'operator_ids', 'regions', 'operators'
+                )))
+        else:
+            resolver = cls.build(plan_files)
+            try:
+                np.savez(
+                    index_path, starts=resolver.starts, ends=resolver.ends,
+                    region_ids=resolver.region_ids, operator_ids=resolver.operator_ids,
+                    regions=resolver.regions, operators=resolver.operators
+                )
+            except OSError as e:
+                logger.warning("Could not save numbering plan index: %s", e)
+
+        logger.info(f"Numbering plan loaded: {len(resolver)} ranges")
+        return resolver
+
+    @classmethod
+    def build(cls, plan_files: Iterable[str]) -> 'PhoneRegionResolver':
+        """Разбор выгрузок: код;от;до;емкость;оператор;регион;..."""
+        import pandas as pd
+        from .data_normalizer import DataNormalizer
+
+        frames = []
+        for path in plan_files:
+            for encoding in ('utf-8', 'cp1251'):
+                try:
+                    frame = pd.read_csv(path, sep=';', usecols=[0, 1, 2, 4, 5], dtype=str,
+                                        keep_default_na=False, encoding=encoding)
+                    break
+                except UnicodeDecodeError:
+                    continue
+            else:
+                raise ValueError(f"Unknown encoding of {path}")
+            frame.columns = ['code', 'start', 'end', 'operator', 'region']
+            frames.append(frame)
+        plan = pd.concat(frames, ignore_index=True)
+
+        code = pd.to_numeric(plan['code'].str.strip(), errors='coerce')
+        starts = code * 10 ** 7 + pd.to_numeric(plan['start'].str.strip(), errors='coerce')
+        ends = code * 10 ** 7 + pd.to_numeric(plan['end'].str.strip(), errors='coerce')
+        valid = starts.notna() & ends.notna()
+
+        plan = plan[valid]
+        order = np.argsort(starts[valid].to_numpy(dtype=np.int64), kind='stable')
+
+        # Регион плана ("г. Москва и Московская область") -> код региона лидов
+        mapping = {**DataNormalizer.REGION_MAPPING, **PLAN_REGION_MAPPING}
+        region_names = plan['region'].str.lower()
+        region_codes = pd.Series(UNKNOWN_REGION, index=plan.index)
+        for region_name, region_code in reversed(list(mapping.items())):
+            region_codes = region_codes.mask(region_names.str.contains(region_name, regex=False), region_code)
+
+        region_ids, regions = pd.factorize(region_codes)
+        operator_ids, operators = pd.factorize(plan['operator'].str.strip())
+        return cls(
+            starts[valid].to_numpy(dtype=np.int64)[order],
+            ends[valid].to_numpy(dtype=np.int64)[order],
+            region_ids.astype(np.int32)[order],
+            operator_ids.astype(np.int32)[order],
+            np.asarray(regions, dtype=str),
+            np.asarray(operators, dtype=str)
+        )
+
+    def lookup(self, phones: Iterable[str]) -> np.ndarray:
+        """Индексы диапазонов для телефонов; -1, если номер не найден"""
+        numbers = phone_numbers(phones)
+        if not len(self):
+            return np.full(len(numbers), -1, dtype=np.int64)
+        positions = np.searchsorted(self.starts, numbers, side='right') - 1
+        clipped = np.maximum(positions, 0)
+        found = (numbers >= 0) & (positions >= 0) & (numbers <= self.ends[clipped])
+        return np.where(found, positions, -1)
+
+    def resolve(self, phones: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Коды регионов и операторы для столбца телефонов ('unknown' и '' для не найденных)"""
+        positions = self.lookup(phones)
+        if not len(self):
+            return np.full(len(positions), UNKNOWN_REGION, dtype=object), np.full(len(positions), '', dtype=object)
+
+        # Выборка из небольших таблиц меток; последняя метка - для не найденных номеров
+        found = positions >= 0
+        region_labels = np.append(self.regions.astype(object), UNKNOWN_REGION)
+        operator_labels = np.append(self.operators.astype(object), '')
+        regions = region_labels[np.where(found, self.region_ids[positions], len(self.regions))]
+        operators = operator_labels[np.where(found, self.operator_ids[positions], len(self.operators))]
+        return regions, operators
+
+    def resolve_regions(self, phones: Iterable[str]) -> np.ndarray:
+        """Коды регионов для столбца телефонов"""
+        return self.resolve(phones)[0]
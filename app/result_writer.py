@@ -0,0 +1,221 @@
+import asyncio
+import csv
+import heapq
+import logging
+import os
+import pickle
+import tempfile
+from typing import Dict, Iterator, List, Optional
+
+from .config import Config
+from .scoring_engine import ScoringEngine
+
+logger = logging.getLogger(__name__)
+
+# Поля результата, которые нужны для CSV и базы данных
+RESULT_FIELDS = (
+    'lead_id', 'phone', 'fio', 'score', 'reason_1', 'reason_2', 'reason_3', 'is_target', 'group'
+)
+
+CSV_FIELDS = ['phone', 'fio', 'score', 'reason_1', 'reason_2', 'reason_3', 'is_target', 'group']
+
+CSV_DEFAULTS = {
+    'phone': '', 'fio': '', 'score': 0, 'reason_1': '', 'reason_2': '',
+    'reason_3': '', 'is_target': 0, 'group': ''
+}
+
+
+def is_exportable(lead) -> bool:
+    """Попадает ли результат скоринга в выгрузку"""
+    return lead.get('is_target') == 1 and lead.get('score', 0) >= ScoringEngine.TARGET_THRESHOLD
+
+
+# Причины отсева лидов с незавершенной проверкой источников: прошлый результат по ним не меняется
+UNRESOLVED_SKIP_REASONS = ('retry_pending', 'source_error')
+
+
+def non_target_result(lead) -> Optional[Dict]:
+    """Результат нецелевого лида для latest_scoring_results.
+
+    Лид, отсеянный планировщиком, записывается с баллом 0. None, если лид
+    целевой (он записывается из выгрузки), не оценен или его проверка не
+    завершена.
+    """
+    skip_reason = lead.get('skip_reason')
+    if skip_reason:
+        if skip_reason in UNRESOLVED_SKIP_REASONS:
+            return None
+        return {'lead_id': lead.get('lead_id'), 'score': 0, 'reason_1': '', 'reason_2': '', 'reason_3': '',
+                'is_target': 0, 'group': lead.get('group')}
+
+    if lead.get('score') is None or is_exportable(lead):
+        return None
+    result = {field: lead.get(field) for field in RESULT_FIELDS}
+    result['is_target'] = 0
+    return result
+
+
+class TopKCollector:
+    """Ограниченная куча: хранит только N лучших результатов по баллу"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._heap = []
+
+    def add(self, score: int, seq: int, row: tuple) -> Optional[tuple]:
+        """Добавление результата; возвращает не попавшую в N лучших строку (новую или вытесненную)"""
+        # При равном балле выигрывает более ранний результат
+        item = (score, -seq, row)
+        if len(self._heap) < self.limit:
+            heapq.heappush(self._heap, item)
+            return None
+        if item > self._heap[0]:
+            return heapq.heapreplace(self._heap, item)[2]
+        return row
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __iter__(self) -> Iterator[tuple]:
+        for _, _, row in sorted(self._heap, reverse=True):
+            yield row
+
+    def close(self):
+        self._heap = []
+
+
+class ExternalSortCollector:
+    """Полная сортировка по убыванию балла со сбросом отсортированных частей на диск"""
+
+    BLOCK_SIZE = 1000
+
+    def __init__(self, buffer_size: int = Config.RESULT_SORT_BUFFER):
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._runs = []
+        self._count = 0
+
+    def add(self, score: int, seq: int, row: tuple) -> Optional[tuple]:
+        self._buffer.append((-score, seq, row))
+        self._count += 1
+        if len(self._buffer) >= self.buffer_size:
+            self._spill()
+        return None
+
+    def _spill(self):
+        """Запись отсортированной части во временный файл"""
+        self._buffer.sort()
+        run = tempfile.TemporaryFile(dir=Config.EXPORT_DIR, prefix='.sort-run-')
+        for i in range(0, len(self._buffer), self.BLOCK_SIZE):
+            pickle.dump(self._buffer[i:i + self.BLOCK_SIZE], run, protocol=pickle.HIGHEST_PROTOCOL)
+        run.seek(0)
+        self._runs.append(run)
+        self._buffer = []
+
+    @staticmethod
+    def _read_run(run) -> Iterator[tuple]:
+        run.seek(0)
+        while True:
+            try:
+                block = pickle.load(run)
+            except EOFError:
+                return
+            yield from block
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[tuple]:
+        self._buffer.sort()
+        runs = [self._read_run(run) for run in self._runs]
+        for _, _, row in heapq.merge(iter(self._buffer), *runs):
+            yield row
+
+    def close(self):
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._buffer = []
+
+
+class ResultExporter:
+    """Потоковый сбор целевых лидов и атомарная выгрузка в exports/.
+
+    В памяти держится либо N лучших результатов (top_n), либо буфер
+    сортировки ограниченного размера; запись CSV выполняется в фоновом
+    потоке во временный файл с последующим атомарным переименованием.
+    """
+
+    def __init__(self, top_n: Optional[int] = None):
+        self.collector = TopKCollector(top_n) if top_n else ExternalSortCollector()
+        self._seq = 0
+        self._dropped: List[tuple] = []
+
+    def add(self, lead) -> bool:
+        """Добавление результата скоринга; True, если лид попал в выгрузку.
+
+        Нецелевые лиды отбрасываются; целевые, не вошедшие в top_n или
+        вытесненные из него, копятся до pop_dropped.
+        """
+        if not is_exportable(lead):
+            return False
+
+        row = tuple(lead.get(field) for field in RESULT_FIELDS)
+        dropped = self.collector.add(lead.get('score', 0), self._seq, row)
+        self._seq += 1
+        if dropped is not None:
+            self._dropped.append(dropped)
+        return dropped is not row
+
+    def pop_dropped(self) -> List[Dict]:
+        """Результаты лидов, отсеченных top_n, как нецелевые (для latest_scoring_results)"""
+        dropped = [{**dict(zip(RESULT_FIELDS, row)), 'is_target': 0} for row in self._dropped]
+        self._dropped = []
+        return dropped
+
+    @property
+    def count(self) -> int:
+        return len(self.collector)
+
+    def iter_results(self) -> Iterator[Dict]:
+        """Результаты по убыванию балла"""
+        for row in self.collector:
+            yield dict(zip(RESULT_FIELDS, row))
+
+    def iter_batches(self, batch_size: int = Config.RESULT_DB_BATCH_SIZE) -> Iterator[List[Dict]]:
+        """Результаты пачками для записи в базу данных"""
+        batch = []
+        for result in self.iter_results():
+            batch.append(result)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def export(self, file_name: str = Config.RESULTS_FILE) -> int:
+        """Запись CSV в фоновом потоке"""
+        return await asyncio.to_thread(self._write_csv, file_name)
+
+    def _write_csv(self, file_name: str) -> int:
+        file_path = os.path.join(Config.EXPORT_DIR, file_name)
+        tmp_path = os.path.join(Config.EXPORT_DIR, f".{file_name}.tmp")
+
+        written = 0
+        with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            for result in self.iter_results():
+                writer.writerow({
+                    field: result[field] if result.get(field) is not None else CSV_DEFAULTS[field]
+                    for field in CSV_FIELDS
+                })
+                written += 1
+
+        # Атомарная подмена: скачивание никогда не увидит недописанный файл
+        os.replace(tmp_path, file_path)
+        logger.info(f"Saved {written} records to {file_path}")
+        return written
+
+    def close(self):
+        self.collector.close()
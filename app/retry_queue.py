@@ -0,0 +1,119 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ErrorBudgetExceeded(Exception):
+    """Слишком много обращений к источникам не удалось даже после повторов"""
+
+
+class RetryQueue:
+    """Отложенные повторы неудачных обращений (лид, источник).
+
+    Неудачное обращение не задерживает основной проход: пара ставится в
+    очередь с экспоненциальной задержкой и джиттером, а очередь
+    обрабатывается после основного прохода. После MAX_RETRIES повторов лид
+    помечается skip_reason='source_error' и не попадает в выгрузку; когда
+    таких пар больше MAX_ERRORS_BEFORE_FAIL, запуск прерывается.
+    """
+
+    def __init__(self, max_retries: int = Config.MAX_RETRIES,
+                 base_delay: float = Config.RETRY_DELAY,
+                 error_budget: int = Config.MAX_ERRORS_BEFORE_FAIL):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.error_budget = error_budget
+        self._heap = []
+        self._seq = itertools.count()
+        self._attempts: Dict[tuple, int] = {}
+        self.deferred = Counter()
+        self.recovered = Counter()
+        self.failed = Counter()
+
+    @property
+    def pending(self) -> int:
+        return len(self._heap)
+
+    def defer(self, lead, source: str, error: Exception):
+        """Постановка неудачного обращения в очередь или окончательный отказ"""
+        key = (id(lead), source)
+        attempt = self._attempts.get(key, 0) + 1
+        self._attempts[key] = attempt
+
+        if attempt > self.max_retries:
+            lead['skip_reason'] = 'source_error'
+            self.failed[source] += 1
+            logger.error("Giving up on %s for lead %s after %d retries: %s",
+                         source, lead.get('lead_id'), self.max_retries, error)
+
+            total_failed = sum(self.failed.values())
+            if total_failed > self.error_budget:
+                raise ErrorBudgetExceeded(
+                    f"{total_failed} source lookups failed after retries, budget is {self.error_budget}"
+                )
+            return
+
+        # Экспоненциальная задержка с джиттером: от половины до полной
+        delay = self.base_delay * 2 ** (attempt - 1)
+        ready_at = time.monotonic() + delay / 2 + random.uniform(0, delay / 2)
+
+        lead['skip_reason'] = 'retry_pending'
+        self.deferred[source] += 1
+        heapq.heappush(self._heap, (ready_at, next(self._seq), lead, source))
+
+    def mark_recovered(self, lead, source: str):
+        """Учет успешного повтора"""
+        if self._attempts.pop((id(lead), source), None):
+            self.recovered[source] += 1
+
+    async def drain(self, handler: Callable[..., Awaitable], concurrency: int = Config.MAX_CONCURRENT_LEADS):
+        """Обработка очереди по мере готовности записей.
+
+        handler(lead, source) повторяет обращение и продолжает обогащение;
+        при новой ошибке он сам возвращает пару в очередь через defer.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = set()
+
+        async def retry(lead, source):
+            try:
+                await handler(lead, source)
+            finally:
+                semaphore.release()
+
+        try:
+            while self._heap or tasks:
+                delay = self._heap[0][0] - time.monotonic() if self._heap else None
+                if delay is None or delay > 0:
+                    if tasks:
+                        done, tasks = await asyncio.wait(tasks, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                        errors = [task.exception() for task in done if task.exception()]
+                        if errors:
+                            raise errors[0]
+                    else:
+                        await asyncio.sleep(delay)
+                    continue
+
+                _, _, lead, source = heapq.heappop(self._heap)
+                await semaphore.acquire()
+                tasks.add(asyncio.ensure_future(retry(lead, source)))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def log_stats(self):
+        """Запись статистики повторов в лог"""
+        for source in sorted(set(self.deferred) | set(self.failed)):
+            logger.info(
+                f"Retries {source}: {self.deferred[source]} deferred, "
+                f"{self.recovered[source]} recovered, {self.failed[source]} failed"
+            )
@@ -0,0 +1,49 @@
+from datetime import date
+from functools import lru_cache
+from typing import Optional
+
+# Даты хранятся и сравниваются как целые дни от 1970-01-01
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Размер кэша разобранных строк дат: в ответах источников даты сильно повторяются
+DATE_CACHE_SIZE = 65536
+
+
+def epoch_day(value: date) -> int:
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def today() -> int:
+    return epoch_day(date.today())
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse_day(value: str) -> Optional[int]:
+    """День по строке 'ДД.ММ.ГГГГ' или ISO ('ГГГГ-ММ-ДД[THH:MM:SS]'); None, если не разбирается"""
+    value = value.strip()
+    try:
+        if '.' in value[:3]:
+            day, month, year = value.split('.')
+            return epoch_day(date(int(year), int(month), int(day)))
+        return epoch_day(date.fromisoformat(value[:10]))
+    except ValueError:
+        return None
+
+
+def as_day(value) -> Optional[int]:
+    """День из сохраненного значения: целое остается как есть, строка разбирается через кэш"""
+    if value is None or isinstance(value, int):
+        return value
+    return parse_day(value) if value else None
+
+
+class RunClock:
+    """Опорная дата запуска.
+
+    Берется один раз на запуск (или из параметров запуска as_of, чтобы
+    процессы скоринга и воркеры очереди считали от той же даты), вместо
+    datetime.now() на каждого лида и каждый источник.
+    """
+
+    def __init__(self, as_of: Optional[int] = None):
+        self.today = today() if as_of is None else as_of
@@ -1,15 +1,49 @@
 import logging
-from datetime import datetime, timedelta
-from typing import Dict
+from typing import Dict, List
+
+from .run_clock import as_day, today
 
 logger = logging.getLogger(__name__)
 
 class ScoringEngine:
+    # Минимальный балл целевого контакта
+    TARGET_THRESHOLD = 50
+    
+    # Правило скоринга -> источник данных, от которого оно зависит
+    RULE_SOURCES = {
+        'debt': 'fssp',
+        'debt_type': 'fssp',
+        'multiple_debts': 'fssp',
+        'property': 'rosreestr',
+        'court_order': 'court',
+        'bankruptcy': 'fedresurs',
+        'inn': 'fns'
+    }
+    
+    # Максимальный балл, который может дать каждое правило
+    RULE_MAX_SCORES = {
+        'debt': 30,
+        'debt_type': 20,
+        'multiple_debts': 5,
+        'property': 10,
+        'court_order': 15,
+        'bankruptcy': 10,
+        'inn': 5
+    }
+    
     def __init__(self):
         self.reasons = []
     
     async def calculate_score(self, lead: Dict, request: Dict) -> Dict:
         """Расчет скоринга для лида"""
+        return self.score_lead(lead, request)
+    
+    def score_batch(self, leads: List[Dict], request: Dict) -> List[Dict]:
+        """Расчет скоринга для пачки лидов"""
+        return [self.score_lead(lead, request) for lead in leads]
+    
+    def score_lead(self, lead: Dict, request: Dict) -> Dict:
+        """Синхронный расчет скоринга для лида"""
         try:
             self.reasons = []  # Сброс причин
             score = 0
@@ -27,29 +61,63 @@ class ScoringEngine:
             score = max(0, min(100, score))
             
             # Определение is_target
-            is_target = 1 if score >= 50 else 0
+            is_target = 1 if score >= self.TARGET_THRESHOLD else 0
             
             # Определение группы для A/B тестов
             group = self._determine_group(lead)
             
-            return {
-                **lead,
+            # Результат дописывается в сам лид, без копирования
+            lead.update({
                 'score': score,
                 'reason_1': self.reasons[0] if len(self.reasons) > 0 else '',
                 'reason_2': self.reasons[1] if len(self.reasons) > 1 else '',
                 'reason_3': self.reasons[2] if len(self.reasons) > 2 else '',
                 'is_target': is_target,
                 'group': group
-            }
+            })
+            return lead
             
         except Exception as e:
-            logger.error(f"Scoring calculation error: {e}")
-            return {
-                **lead,
+            logger.error("Scoring calculation error: %s", e)
+            lead.update({
                 'score': 0,
                 'reason_1': 'Calculation error',
                 'is_target': 0
-            }
+            })
+            return lead
+    
+    def score_upper_bound(self, lead: Dict, request: Dict, resolved_sources: set) -> int:
+        """Максимально достижимый балл, если неизвестные источники дадут лучший результат"""
+        saved_reasons = self.reasons
+        self.reasons = []
+        try:
+            bound = 0
+            for rule, source in self.RULE_SOURCES.items():
+                if source in resolved_sources:
+                    bound += self._rule_score(rule, lead, request)
+                else:
+                    bound += self.RULE_MAX_SCORES[rule]
+            return min(100, bound)
+        finally:
+            self.reasons = saved_reasons
+    
+    def _rule_score(self, rule: str, lead: Dict, request: Dict) -> int:
+        """Баллы одного правила скоринга"""
+        if rule == 'debt':
+            return self._calculate_debt_score(lead, request)
+        elif rule == 'debt_type':
+            return self._calculate_debt_type_score(lead, request)
+        elif rule == 'multiple_debts':
+            return self._calculate_multiple_debts_score(lead)
+        elif rule == 'property':
+            return self._calculate_property_score(lead, request)
+        elif rule == 'court_order':
+            return self._calculate_court_order_score(lead, request)
+        elif rule == 'bankruptcy':
+            return self._calculate_bankruptcy_score(lead, request)
+        elif rule == 'inn':
+            return self._calculate_inn_score(lead, request)
+        return 0
     
     def _add_reason(self, reason: str):
         """Добавление причины в список"""
@@ -93,16 +161,16 @@ class ScoringEngine:
     def _calculate_court_order_score(self, lead: Dict, request: Dict) -> int:
         """Расчет баллов за судебные приказы"""
         has_court_order = lead.get('court_has_order', False)
-        court_date = lead.get('court_order_date', '')
+        order_day = as_day(lead.get('court_order_date'))
         
-        if has_court_order and court_date:
-            try:
-                order_date = datetime.fromisoformat(court_date)
-                if datetime.now() - order_date < timedelta(days=90):
-                    self._add_reason("Судебный приказ (последние 3 мес)")
-                    return 15
-            except:
-                pass
+        if has_court_order and order_day is not None:
+            # Опорная дата запуска (as_of) одна для всех лидов и процессов
+            as_of = request.get('as_of')
+            if as_of is None:
+                as_of = today()
+            if as_of - order_day < 90:
+                self._add_reason("Судебный приказ (последние 3 мес)")
+                return 15
         return 0
     
     def _calculate_bankruptcy_score(self, lead: Dict, request: Dict) -> int:
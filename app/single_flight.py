@@ -0,0 +1,55 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Объединение одновременных одинаковых запросов к внешним источникам.
+
+    Ключ - пара (источник, естественный ключ). Пока запрос по ключу выполняется,
+    все остальные вызовы с тем же ключом ждут его и получают тот же результат
+    (или то же исключение).
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+        self._calls = defaultdict(int)
+        self._coalesced = defaultdict(int)
+
+    async def do(self, source: str, key: Hashable, func: Callable[[], Awaitable]):
+        """Выполнение запроса или присоединение к уже выполняющемуся"""
+        flight_key = (source, key)
+        self._calls[source] += 1
+
+        task = self._inflight.get(flight_key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[flight_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(flight_key, None))
+        else:
+            self._coalesced[source] += 1
+
+        # shield: отмена одного из ожидающих не должна отменять общий запрос
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Статистика вызовов по источникам"""
+        return {
+            source: {
+                'calls': calls,
+                'executed': calls - self._coalesced[source],
+                'coalesced': self._coalesced[source]
+            }
+            for source, calls in self._calls.items()
+        }
+
+    def log_stats(self):
+        """Запись статистики в лог"""
+        for source, stats in self.stats().items():
+            logger.info(
+                f"Single-flight {source}: {stats['calls']} calls, "
+                f"{stats['executed']} executed, {stats['coalesced']} coalesced"
+            )
@@ -0,0 +1,233 @@
+import asyncio
+import csv
+import hashlib
+import logging
+import os
+import tempfile
+import zlib
+from typing import Dict, Optional
+
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+from .config import Config
+from .data_normalizer import DataNormalizer
+
+logger = logging.getLogger(__name__)
+
+# Недописанные загрузки лежат рядом с data/, чтобы перенос в data/ был атомарным
+UPLOAD_TMP_SUBDIR = ".uploads"
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class UploadError(Exception):
+    """Загрузка отклонена: неверный запрос, формат или заголовок файла"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UploadWriter:
+    """Прием файла из multipart-потока: запись на диск по частям, SHA-256 и проверка заголовка CSV.
+
+    Обработчики вызываются парсером python-multipart; в памяти остается
+    только текущая часть потока и начало файла до конца строки заголовка.
+    """
+
+    def __init__(self, tmp_dir: str, max_bytes: int = Config.UPLOAD_MAX_BYTES):
+        self.tmp_dir = tmp_dir
+        self.max_bytes = max_bytes
+        self.file_name: Optional[str] = None
+        self.tmp_path: Optional[str] = None
+        self.size = 0
+        self.content_hash = None
+        self.compressed = False
+        self._file = None
+        self._in_file = False
+        self._header = bytearray()
+        self._header_checked = False
+        self._decompressor = None
+        self._part_headers: Dict[bytes, bytes] = {}
+        self._header_field = b''
+        self._header_value = b''
+
+    @property
+    def callbacks(self) -> Dict:
+        return {
+            'on_part_begin': self._on_part_begin,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+        }
+
+    def _on_part_begin(self):
+        self._part_headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._part_headers[self._header_field.lower()] = self._header_value
+        self._header_field = b''
+        self._header_value = b''
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._part_headers.get(b'content-disposition', b''))
+        file_name = options.get(b'filename')
+        # Поля формы без файла пропускаются
+        if file_name is None:
+            return
+        if self.file_name is not None:
+            raise UploadError("Only one file per upload is supported")
+
+        self.file_name = os.path.basename(file_name.decode('utf-8', 'replace'))
+        if self.file_name.endswith('.csv.gz'):
+            self.compressed = True
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif not self.file_name.endswith('.csv'):
+            raise UploadError("Only .csv and .csv.gz files are accepted")
+
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=self.tmp_dir, suffix='.part', delete=False)
+        self.tmp_path = self._file.name
+        self.content_hash = hashlib.sha256()
+        self._in_file = True
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if not self._in_file:
+            return
+
+        chunk = data[start:end]
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadError(f"File is larger than {self.max_bytes} bytes", status_code=413)
+
+        if not self._header_checked:
+            self._check_header(chunk)
+        self.content_hash.update(chunk)
+        self._file.write(chunk)
+
+    def _on_part_end(self):
+        if not self._in_file:
+            return
+        self._in_file = False
+        if not self._header_checked:
+            # Файл из одной строки без перевода строки в конце
+            self._validate_header(bytes(self._header))
+
+    def _check_header(self, chunk: bytes):
+        """Накопление начала файла до конца первой строки; gzip распаковывается только здесь"""
+        if self._decompressor is not None:
+            if self.size == len(chunk) and not chunk.startswith(GZIP_MAGIC):
+                raise UploadError("File is not a valid gzip archive")
+            try:
+                chunk = self._decompressor.decompress(chunk, Config.UPLOAD_MAX_HEADER_BYTES + 1)
+            except zlib.error:
+                raise UploadError("File is not a valid gzip archive") from None
+
+        self._header += chunk
+        line_end = self._header.find(b'\n')
+        if line_end >= 0:
+            self._validate_header(bytes(self._header[:line_end]))
+        elif len(self._header) > Config.UPLOAD_MAX_HEADER_BYTES:
+            raise UploadError(f"CSV header is longer than {Config.UPLOAD_MAX_HEADER_BYTES} bytes")
+
+    def _validate_header(self, line: bytes):
+        try:
+            text = line.decode('utf-8-sig').rstrip('\r')
+        except UnicodeDecodeError:
+            raise UploadError("CSV header must be UTF-8") from None
+        if not text:
+            raise UploadError("File is empty")
+
+        columns = {column.strip() for column in next(csv.reader([text]))}
+        missing = [column for column in DataNormalizer.REQUIRED_COLUMNS if column not in columns]
+        if missing:
+            raise UploadError(f"CSV header is missing columns: {', '.join(missing)}")
+
+        self._header_checked = True
+        self._header = bytearray()
+        self._decompressor = None
+
+    def finish(self) -> str:
+        """Сброс файла на диск; возвращает SHA-256 содержимого"""
+        if self.file_name is None:
+            raise UploadError("No file in upload")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        return self.content_hash.hexdigest()
+
+    def discard(self):
+        if self._file is not None:
+            self._file.close()
+        if self.tmp_path and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def _feed(parser: MultipartParser, data) -> None:
+    """Передача данных парсеру частями не больше UPLOAD_CHUNK_SIZE"""
+    view = memoryview(data)
+    for offset in range(0, len(view), Config.UPLOAD_CHUNK_SIZE):
+        parser.write(bytes(view[offset:offset + Config.UPLOAD_CHUNK_SIZE]))
+
+
+async def receive_upload(request, db_manager, data_dir: str = Config.DATA_DIR) -> Dict:
+    """Прием файла лидов из тела запроса и регистрация в data/.
+
+    Поток разбирается частями по UPLOAD_CHUNK_SIZE в отдельном потоке, чтобы
+    разбор, хэширование и запись не занимали event loop. Файл с уже
+    известным хэшем не сохраняется повторно. Готовый файл атомарно
+    переносится в data/ под именем по хэшу и подхватывается ближайшим
+    запуском скоринга.
+    """
+    content_type, options = parse_options_header(request.headers.get('content-type', ''))
+    if content_type != b'multipart/form-data' or b'boundary' not in options:
+        raise UploadError("Expected multipart/form-data with a boundary")
+
+    writer = UploadWriter(os.path.join(data_dir, UPLOAD_TMP_SUBDIR))
+    parser = MultipartParser(options[b'boundary'], writer.callbacks)
+
+    try:
+        # Мелкие части потока копятся до UPLOAD_CHUNK_SIZE, чтобы не переключаться на поток ради каждой
+        buffer = bytearray()
+        async for chunk in request.stream():
+            if not buffer and len(chunk) >= Config.UPLOAD_CHUNK_SIZE:
+                await asyncio.to_thread(_feed, parser, chunk)
+                continue
+            buffer += chunk
+            if len(buffer) >= Config.UPLOAD_CHUNK_SIZE:
+                await asyncio.to_thread(_feed, parser, buffer)
+                buffer = bytearray()
+        if buffer:
+            await asyncio.to_thread(_feed, parser, buffer)
+        parser.finalize()
+        content_hash = await asyncio.to_thread(writer.finish)
+    except MultipartParseError as e:
+        writer.discard()
+        raise UploadError(f"Malformed multipart body: {e}") from None
+    except BaseException:
+        writer.discard()
+        raise
+
+    existing = await db_manager.get_upload(content_hash)
+    if existing is not None:
+        writer.discard()
+        logger.info(f"Upload {writer.file_name} is a duplicate of {existing['file_name']}")
+        return {**existing, 'duplicate': True}
+
+    extension = '.csv.gz' if writer.compressed else '.csv'
+    file_name = f"upload_{content_hash[:16]}{extension}"
+    await asyncio.to_thread(os.replace, writer.tmp_path, os.path.join(data_dir, file_name))
+
+    upload = await db_manager.register_upload(content_hash, file_name, writer.file_name, writer.size)
+    logger.info(f"Uploaded {writer.file_name} as {file_name}: {writer.size} bytes")
+    return {**upload, 'duplicate': False}
@@ -0,0 +1,257 @@
+import asyncio
+import json
+import logging
+import pickle
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from .config import Config
+from .result_writer import RESULT_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+class WorkQueue:
+    """Надежная очередь шардов лидов в SQLite.
+
+    Координатор делит запуск на шарды, воркеры (python -m app.worker)
+    забирают их с арендой на WORK_LEASE_SECONDS и публикуют результаты.
+    Шард с просроченной арендой (воркер упал) снова выдается другому
+    воркеру. Файл базы может быть общим для нескольких процессов и хостов.
+    """
+
+    def __init__(self, db_path: str = Config.WORK_QUEUE_PATH):
+        self.db_path = db_path
+
+    @contextmanager
+    def get_connection(self):
+        # Транзакции управляются явно, захват шарда - через BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def init_queue(self):
+        with self.get_connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS work_runs (
+                    run_id TEXT PRIMARY KEY,
+                    request TEXT,
+                    total_shards INTEGER,
+                    status TEXT,
+                    created_at REAL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS work_shards (
+                    run_id TEXT,
+                    shard_no INTEGER,
+                    status TEXT,
+                    worker_id TEXT,
+                    lease_expires_at REAL,
+                    attempts INTEGER DEFAULT 0,
+                    leads BLOB,
+                    results BLOB,
+                    stats TEXT,
+                    error TEXT,
+                    PRIMARY KEY (run_id, shard_no)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_work_shards_status ON work_shards(status, lease_expires_at)")
+
+    def submit(self, run_id: str, leads: List, request: Dict,
+               shard_size: int = Config.WORK_SHARD_SIZE) -> int:
+        """Постановка запуска в очередь, возвращает число шардов"""
+        shards = [leads[i:i + shard_size] for i in range(0, len(leads), shard_size)]
+        with self.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO work_runs (run_id, request, total_shards, status, created_at) VALUES (?, ?, ?, 'running', ?)",
+                (run_id, json.dumps(request, ensure_ascii=False), len(shards), time.time())
+            )
+            conn.executemany(
+                "INSERT INTO work_shards (run_id, shard_no, status, leads) VALUES (?, ?, 'pending', ?)",
+                (
+                    (run_id, shard_no, pickle.dumps(shard, protocol=pickle.HIGHEST_PROTOCOL))
+                    for shard_no, shard in enumerate(shards)
+                )
+            )
+            conn.execute("COMMIT")
+        logger.info(f"Submitted run {run_id}: {len(leads)} leads in {len(shards)} shards")
+        return len(shards)
+
+    def claim(self, worker_id: str, max_attempts: int = Config.MAX_RETRIES) -> Optional[Dict]:
+        """Захват свободного шарда или шарда с просроченной арендой.
+
+        Шард, аренда которого истекла после max_attempts попыток (воркеры
+        на нем падают), больше не выдается и помечается как failed.
+        """
+        now = time.time()
+        with self.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("""
+                UPDATE work_shards
+                SET status = 'failed', error = 'lease expired after ' || attempts || ' attempts',
+                    worker_id = NULL, lease_expires_at = NULL
+                WHERE status = 'claimed' AND lease_expires_at < ? AND attempts >= ?
+            """, (now, max_attempts))
+            row = conn.execute("""
+                SELECT s.run_id, s.shard_no, s.leads, r.request
+                FROM work_shards s JOIN work_runs r ON r.run_id = s.run_id
+                WHERE s.status = 'pending'
+                   OR (s.status = 'claimed' AND s.lease_expires_at < ? AND s.attempts < ?)
+                ORDER BY r.created_at, s.shard_no
+                LIMIT 1
+            """, (now, max_attempts)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            run_id, shard_no, leads, request = row
+            conn.execute("""
+                UPDATE work_shards SET status = 'claimed', worker_id = ?, lease_expires_at = ?, attempts = attempts + 1
+                WHERE run_id = ? AND shard_no = ?
+            """, (worker_id, now + Config.WORK_LEASE_SECONDS, run_id, shard_no))
+            conn.execute("COMMIT")
+
+        return {
+            'run_id': run_id,
+            'shard_no': shard_no,
+            'leads': pickle.loads(leads),
+            'request': json.loads(request)
+        }
+
+    def extend_lease(self, run_id: str, shard_no: int, worker_id: str) -> bool:
+        """Продление аренды; False, если шард уже отдан другому воркеру"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("""
+                UPDATE work_shards SET lease_expires_at = ?
+                WHERE run_id = ? AND shard_no = ? AND worker_id = ? AND status = 'claimed'
+            """, (time.time() + Config.WORK_LEASE_SECONDS, run_id, shard_no, worker_id))
+            return cursor.rowcount == 1
+
+    def complete(self, run_id: str, shard_no: int, worker_id: str, results: List[tuple], stats: Dict) -> bool:
+        """Публикация результатов шарда"""
+        with self.get_connection() as conn:
+            cursor = conn.execute("""
+                UPDATE work_shards SET status = 'done', results = ?, stats = ?, leads = NULL
+                WHERE run_id = ? AND shard_no = ? AND worker_id = ? AND status = 'claimed'
+            """, (
+                pickle.dumps(results, protocol=pickle.HIGHEST_PROTOCOL),
+                json.dumps(stats), run_id, shard_no, worker_id
+            ))
+            return cursor.rowcount == 1
+
+    def fail(self, run_id: str, shard_no: int, worker_id: str, error: str,
+             max_attempts: int = Config.MAX_RETRIES):
+        """Возврат шарда в очередь или окончательная ошибка после max_attempts попыток"""
+        with self.get_connection() as conn:
+            conn.execute("""
+                UPDATE work_shards
+                SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                    error = ?, worker_id = NULL, lease_expires_at = NULL
+                WHERE run_id = ? AND shard_no = ? AND worker_id = ? AND status = 'claimed'
+            """, (max_attempts, error, run_id, shard_no, worker_id))
+
+    def progress(self, run_id: str) -> Dict[str, int]:
+        """Число шардов запуска по статусам"""
+        with self.get_connection() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) FROM work_shards WHERE run_id = ? GROUP BY status", (run_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def failures(self, run_id: str) -> List[tuple]:
+        """Номера и ошибки окончательно неудачных шардов запуска"""
+        with self.get_connection() as conn:
+            return conn.execute(
+                "SELECT shard_no, error FROM work_shards WHERE run_id = ? AND status = 'failed' ORDER BY shard_no",
+                (run_id,)
+            ).fetchall()
+
+    def iter_results(self, run_id: str):
+        """Результаты и статистика готовых шардов по одному"""
+        with self.get_connection() as conn:
+            shard_numbers = [row[0] for row in conn.execute(
+                "SELECT shard_no FROM work_shards WHERE run_id = ? AND status = 'done' ORDER BY shard_no", (run_id,)
+            )]
+            for shard_no in shard_numbers:
+                results, stats = conn.execute(
+                    "SELECT results, stats FROM work_shards WHERE run_id = ? AND shard_no = ?", (run_id, shard_no)
+                ).fetchone()
+                yield pickle.loads(results), json.loads(stats)
+
+    def finish(self, run_id: str, status: str):
+        """Закрытие запуска и удаление данных шардов"""
+        with self.get_connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE work_runs SET status = ? WHERE run_id = ?", (status, run_id))
+            conn.execute("DELETE FROM work_shards WHERE run_id = ?", (run_id,))
+            conn.execute("COMMIT")
+
+
+class Coordinator:
+    """Раздача запуска воркерам и сборка их результатов в один запуск"""
+
+    def __init__(self, queue: Optional[WorkQueue] = None):
+        self.queue = queue or WorkQueue()
+
+    async def run(self, run_id: str, leads: List, request: Dict, exporter,
+                  on_progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """Постановка шардов, ожидание воркеров и слияние результатов в exporter.
+
+        Возвращает сводную статистику воркеров.
+        """
+        await asyncio.to_thread(self.queue.init_queue)
+        total = await asyncio.to_thread(self.queue.submit, run_id, leads, request)
+
+        try:
+            await self._wait(run_id, total, on_progress)
+            stats = await asyncio.to_thread(self._merge, run_id, exporter)
+        except BaseException:
+            await asyncio.to_thread(self.queue.finish, run_id, 'error')
+            raise
+
+        await asyncio.to_thread(self.queue.finish, run_id, 'merged')
+        return stats
+
+    async def _wait(self, run_id: str, total: int, on_progress):
+        started = time.monotonic()
+        while True:
+            progress = await asyncio.to_thread(self.queue.progress, run_id)
+            if progress.get('failed'):
+                failures = await asyncio.to_thread(self.queue.failures, run_id)
+                for shard_no, error in failures:
+                    logger.error("Shard %s of run %s failed: %s", shard_no, run_id, error)
+                shard_no, error = failures[0]
+                raise RuntimeError(f"{len(failures)} shards of run {run_id} failed, shard {shard_no}: {error}")
+
+            done = progress.get('done', 0)
+            if on_progress:
+                on_progress(done, total)
+            if done >= total:
+                return
+
+            if time.monotonic() - started > Config.WORK_RUN_TIMEOUT:
+                raise TimeoutError(f"Run {run_id} did not finish in {Config.WORK_RUN_TIMEOUT}s")
+            await asyncio.sleep(Config.WORK_POLL_INTERVAL)
+
+    def _merge(self, run_id: str, exporter) -> Dict:
+        stats = {'source_stats': {}, 'retry_failed': {}}
+        for results, shard_stats in self.queue.iter_results(run_id):
+            for row in results:
+                exporter.add(dict(zip(RESULT_FIELDS, row)))
+
+            for source, counts in shard_stats['source_stats'].items():
+                merged = stats['source_stats'].setdefault(source, {})
+                for name, value in counts.items():
+                    merged[name] = merged.get(name, 0) + value
+            for source, count in shard_stats['retry_failed'].items():
+                stats['retry_failed'][source] = stats['retry_failed'].get(source, 0) + count
+
+        logger.info(f"Merged run {run_id}: {exporter.count} target contacts")
+        return stats
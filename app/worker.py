@@ -0,0 +1,144 @@
+import argparse
+import asyncio
+import logging
+import os
+import socket
+from typing import Dict, List, Tuple
+
+from .config import Config
+from .logging_setup import setup_logging, shutdown_logging, log_context
+from .work_queue import WorkQueue
+
+logger = logging.getLogger(__name__)
+
+
+class EnrichmentWorker:
+    """Воркер: забирает шарды из очереди, обогащает и скорит лиды, публикует результаты.
+
+    Воркеры независимы друг от друга, поэтому их можно запускать в любом
+    количестве процессов и на нескольких хостах с общим файлом очереди;
+    каждый использует свой event loop и свой набор прокси.
+    """
+
+    def __init__(self, worker_id: str, queue: WorkQueue = None):
+        from .database import DatabaseManager
+        from .scoring_engine import ScoringEngine
+        self.worker_id = worker_id
+        self.queue = queue or WorkQueue()
+        self.db_manager = DatabaseManager()
+        self.scoring_engine = ScoringEngine()
+        self.parsers = None
+
+    async def run(self, once: bool = False):
+        """Обработка шардов; с once=True - до опустошения очереди"""
+        from .external_parsers import ExternalParsers
+
+        await asyncio.to_thread(self.queue.init_queue)
+        await self.db_manager.init_database()
+        logger.info(f"Worker {self.worker_id} started")
+
+        async with ExternalParsers() as parsers:
+            self.parsers = parsers
+            while True:
+                shard = await asyncio.to_thread(self.queue.claim, self.worker_id)
+                if shard is None:
+                    if once:
+                        break
+                    await asyncio.sleep(Config.WORK_POLL_INTERVAL)
+                    continue
+
+                with log_context(run_id=shard['run_id']):
+                    await self._run_shard(shard)
+
+        logger.info(f"Worker {self.worker_id} stopped")
+
+    async def _run_shard(self, shard: Dict):
+        run_id, shard_no = shard['run_id'], shard['shard_no']
+        heartbeat = asyncio.ensure_future(self._heartbeat(run_id, shard_no))
+        try:
+            results, stats = await self.process(shard['leads'], shard['request'])
+        except Exception as e:
+            logger.error("Shard %s of run %s failed: %s", shard_no, run_id, e, exc_info=True)
+            await asyncio.to_thread(self.queue.fail, run_id, shard_no, self.worker_id, str(e))
+            return
+        finally:
+            heartbeat.cancel()
+        
+        # Признаки нужны для пересчета без обогащения (/api/rescore)
+        try:
+            await self.db_manager.save_features(shard['leads'], run_id)
+        except Exception as e:
+            logger.error("Error saving lead features of shard %s: %s", shard_no, e)
+
+        published = await asyncio.to_thread(
+            self.queue.complete, run_id, shard_no, self.worker_id, results, stats
+        )
+        if published:
+            logger.info(f"Shard {shard_no} of run {run_id}: {len(results)} target contacts")
+            # Лиды шарда, переставшие быть целевыми, снимаются с целевых в последних результатах
+            try:
+                from .result_writer import non_target_result
+                non_targets = [result for result in map(non_target_result, shard['leads']) if result]
+                await self.db_manager.save_latest_results(non_targets, run_id)
+            except Exception as e:
+                logger.error("Error saving non-target results of shard %s: %s", shard_no, e)
+        else:
+            logger.warning("Shard %s of run %s was reassigned, results dropped", shard_no, run_id)
+
+    async def _heartbeat(self, run_id: str, shard_no: int):
+        while True:
+            await asyncio.sleep(Config.WORK_LEASE_SECONDS / 3)
+            await asyncio.to_thread(self.queue.extend_lease, run_id, shard_no, self.worker_id)
+
+    async def process(self, leads: List, request: Dict) -> Tuple[List[tuple], Dict]:
+        """Обогащение и скоринг шарда; возвращает строки целевых лидов и статистику"""
+        from .deadlines import gather_or_cancel
+        from .enrichment_planner import EnrichmentPlanner
+        from .result_writer import RESULT_FIELDS, is_exportable
+        from .run_clock import RunClock
+        from .single_flight import SingleFlight
+
+        # Статистика объединения запросов считается по шарду
+        self.parsers.single_flight = SingleFlight()
+        self.parsers.clock = RunClock(request.get('as_of'))
+        planner = EnrichmentPlanner(self.parsers, request)
+        semaphore = asyncio.Semaphore(Config.MAX_CONCURRENT_LEADS)
+
+        async def enrich_lead(lead):
+            async with semaphore:
+                with log_context(lead_id=lead.get('lead_id')):
+                    await planner.enrich(lead)
+
+        await gather_or_cancel(enrich_lead(lead) for lead in leads)
+        if planner.retry_queue.pending:
+            await planner.retry_queue.drain(planner.resume)
+        planner.log_stats()
+        planner.retry_queue.log_stats()
+        self.parsers.fssp_sessions.log_stats()
+
+        enriched = [lead for lead in leads if not lead.get('skip_reason')]
+        scored = self.scoring_engine.score_batch(enriched, request)
+
+        results = [tuple(lead.get(field) for field in RESULT_FIELDS) for lead in scored if is_exportable(lead)]
+        stats = {
+            'source_stats': self.parsers.single_flight.stats(),
+            'retry_failed': dict(planner.retry_queue.failed)
+        }
+        return results, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воркер обогащения лидов из локальной очереди")
+    parser.add_argument('--worker-id', default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument('--once', action='store_true', help="Завершиться, когда очередь пуста")
+    args = parser.parse_args()
+
+    setup_logging()
+    try:
+        asyncio.run(EnrichmentWorker(args.worker_id).run(once=args.once))
+    finally:
+        shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Эталонные тесты разбора HTML ФССП и судов.
+
+Ожидаемые результаты в tests/golden/ получены прежним разбором полным
+деревом BeautifulSoup (html.parser) по сохраненным страницам
+benchmarks/pages/; ограниченный разбор должен совпадать с ним на обоих бэкендах.
+"""
+import json
+import os
+
+import pytest
+
+from app import html_parser
+from app.html_parser import parse_captcha_form, parse_court_dates, parse_fssp_results
+
+PAGES_DIR = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "pages")
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), "golden")
+
+
+def _read(directory: str, file_name: str) -> str:
+    with open(os.path.join(directory, file_name), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.fixture(params=["lxml", "html.parser"], autouse=True)
+def backend(request, monkeypatch):
+    if request.param == "lxml":
+        pytest.importorskip("lxml")
+    monkeypatch.setattr(html_parser, "HTML_BACKEND", request.param)
+    return request.param
+
+
+@pytest.mark.parametrize("parser, page", [
+    (parse_captcha_form, "captcha_form"),
+    (parse_fssp_results, "fssp_results"),
+    (parse_court_dates, "court_results"),
+])
+def test_saved_pages_match_golden(parser, page):
+    expected = json.loads(_read(GOLDEN_DIR, f"{page}.json"))
+    assert parser(_read(PAGES_DIR, f"{page}.html")) == expected
+
+
+def test_fssp_skips_incomplete_rows():
+    html = """
+    <div class="search-result-item">
+      <div class="amount">1 200,50</div><div class="creditor"> Банк </div><div class="type">bank</div>
+    </div>
+    <div class="search-result-item"><div class="amount">не число</div><div class="creditor">X</div><div class="type">mfo</div></div>
+    <div class="search-result-item"><div class="amount">100</div><div class="type">tax</div></div>
+    <div class="other"><div class="amount">999</div></div>
+    """
+    assert parse_fssp_results(html) == [{'amount': 1200.5, 'creditor': 'Банк', 'type': 'bank'}]
+
+
+def test_fssp_empty_page():
+    assert parse_fssp_results("<html><body><p>Ничего не найдено</p></body></html>") == []
+
+
+def test_captcha_form_missing():
+    assert parse_captcha_form("<form><input name='other' value='1'></form>") == {
+        'captcha_url': None,
+        'captcha_token': None
+    }
+
+
+def test_court_dates_nested_markup():
+    html = """
+    <div class="resultItem"><span class="date"> 01.02.2024 </span></div>
+    <div class="resultItem"><div><b class="date">15.03.2024</b></div></div>
+    <div class="resultItem"><span class="number">2-100/2024</span></div>
+    """
+    assert parse_court_dates(html) == ["01.02.2024", "15.03.2024"]
@@ -0,0 +1,45 @@
+"""Агрегация одинаковых ошибок в AggregatingHandler."""
+import logging
+
+from app.logging_setup import AggregatingHandler, ContextFilter
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _error(msg, *args):
+    record = logging.getLogger("app.test").makeRecord(
+        "app.test", logging.ERROR, __file__, 1, msg, args, None
+    )
+    ContextFilter().filter(record)
+    return record
+
+
+def test_same_template_with_different_args_is_aggregated():
+    output = ListHandler()
+    handler = AggregatingHandler([output], window=60, burst=1)
+
+    handler.handle(_error("Error scoring lead %s: %s", "lead_1", "boom"))
+    handler.handle(_error("Error scoring lead %s: %s", "lead_2", "bang"))
+    handler.handle(_error("Error scoring lead %s: %s", "lead_3", "bang"))
+    assert [record.getMessage() for record in output.records] == ["Error scoring lead lead_1: boom"]
+
+    handler.flush_summaries()
+    summary = output.records[-1]
+    assert summary.suppressed == 2
+    assert summary.getMessage() == "Suppressed 2 similar errors in 60s, last: Error scoring lead lead_3: bang"
+
+
+def test_different_templates_are_not_aggregated():
+    output = ListHandler()
+    handler = AggregatingHandler([output], window=60, burst=1)
+
+    handler.handle(_error("Error saving lead features: %s", "locked"))
+    handler.handle(_error("Error saving run status: %s", "locked"))
+    assert len(output.records) == 2